@@ -0,0 +1,261 @@
+"""Асинхронный путь чтения для горячих GET-запросов.
+
+Под ASGI такие запросы не держат поток на время ожидания БД и кэша:
+чтение идёт через асинхронный ORM и кэш. Всё остальное — запись,
+нестандартные параметры, неудачная авторизация — уходит в обычное
+представление DRF в пуле потоков."""
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.http import HttpResponse
+from rest_framework.authtoken.models import Token
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from api.authentication import aget_cached_token, aremember_token
+from api.cache import (
+    RECIPE_GENERATION_KEY,
+    RECIPE_VERSION_KEY,
+    aget_versions,
+    anonymize,
+    apply_user_flags,
+    entry_recipes,
+    make_reference_entry,
+    recipe_detail_key,
+    recipe_list_key,
+    recipe_version_keys,
+    reference_cache_key,
+    reference_cache_timeout,
+    reference_response,
+)
+from api.filters import RecipeFilter
+from api.serializers import (
+    IngredientSerializer,
+    ReadRecipeSerializer,
+    TagSerializer,
+)
+from api.views import IngredientsViewSet, RecipeViewSet, TagsViewSet
+from foodgram.db_router import use_primary
+from recipes.autocomplete import ingredient_index
+from recipes.memberships import amemberships_for
+from recipes.models import Ingredient, Recipe, Tag
+
+
+class JSONResponse(HttpResponse):
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault("content_type", "application/json")
+        super().__init__(JSONRenderer().render(data), **kwargs)
+
+
+async def get_token_user(request):
+    """Пользователь по заголовку «Authorization: Token ...», как в
+    TokenAuthentication. None — токен неверный, и ошибку отдаст DRF."""
+    auth = request.headers.get("Authorization", "").split()
+    if not auth or auth[0].lower() != "token":
+        return AnonymousUser()
+    if len(auth) != 2:
+        return None
+    token = await aget_cached_token(auth[1])
+    if token is None:
+        with use_primary():
+            token = await Token.objects.select_related("user").filter(
+                key=auth[1]
+            ).afirst()
+        if token is None:
+            return None
+        if token.user.is_active:
+            await aremember_token(token)
+    if not token.user.is_active:
+        return None
+    return token.user
+
+
+def async_read_view(view, handler, accepts=None):
+    """Обёртка над представлением DRF: GET обслуживает корутина handler,
+    а если она вернула None — само представление. accepts заранее
+    отсеивает запросы, которые handler не обслужит, чтобы не проверять
+    токен дважды."""
+    sync_view = sync_to_async(view)
+
+    async def async_view(request, *args, **kwargs):
+        if request.method == "GET" and (
+            accepts is None or accepts(request)
+        ):
+            user = await get_token_user(request)
+            if user is not None:
+                response = await handler(request, user, *args, **kwargs)
+                if response is not None:
+                    return response
+        return await sync_view(request, *args, **kwargs)
+
+    async_view.csrf_exempt = True
+    # Метки для RequestMetricsMiddleware, как у представления DRF.
+    async_view.cls = view.cls
+    async_view.actions = view.actions
+    return async_view
+
+
+async def reference_list(request, name, queryset, serializer_class):
+    key = reference_cache_key(name)
+    entry = await cache.aget(key)
+    if entry is None:
+        with use_primary():
+            items = [item async for item in queryset.aiterator()]
+        entry = make_reference_entry(
+            serializer_class(items, many=True).data
+        )
+        await cache.aset(key, entry, reference_cache_timeout())
+    return reference_response(request, entry, JSONResponse)
+
+
+async def tag_list(request, user):
+    return await reference_list(request, "tags", Tag.objects.all(),
+                                TagSerializer)
+
+
+async def ingredient_list(request, user):
+    name = request.GET.get("name")
+    if name:
+        # Индекс в памяти; в поток уходит только его перестройка.
+        return JSONResponse(
+            await sync_to_async(ingredient_index.search)(name)
+        )
+    return await reference_list(request, "ingredients",
+                                Ingredient.objects.all(),
+                                IngredientSerializer)
+
+
+async def cached_recipe_response(key, request):
+    """Ответ из кэша; без общего кэша ответы не кэшируются (см.
+    api.cache.CachedRecipeResponseMixin) и обработчик идёт в БД."""
+    if not settings.SHARED_CACHE:
+        return None
+    entry = await cache.aget(key)
+    if entry is None or (
+        await cache.aget_many(entry["versions"]) != entry["versions"]
+    ):
+        return None
+    data = entry["data"]
+    if request.user.is_authenticated:
+        data = apply_user_flags(data, await amemberships_for(request))
+    return JSONResponse(data)
+
+
+async def store_recipe_response(key, data, versions, timeout):
+    if not settings.SHARED_CACHE:
+        return
+    versions = {
+        **await aget_versions(recipe_version_keys(entry_recipes(data))),
+        **versions,
+    }
+    await cache.aset(
+        key, {"data": anonymize(data), "versions": versions}, timeout
+    )
+
+
+async def recipe_versions(keys):
+    """Версии до выборки; без общего кэша они не нужны."""
+    if not settings.SHARED_CACHE:
+        return {}
+    return await aget_versions(keys)
+
+
+def get_drf_request(request, user):
+    drf_request = Request(request)
+    drf_request.user = user
+    return drf_request
+
+
+async def recipe_list(request, user):
+    key = recipe_list_key(request)
+    drf_request = get_drf_request(request, user)
+    response = await cached_recipe_response(key, drf_request)
+    if response is not None:
+        return response
+    # Промах заполняет кэш, поэтому читает с основной базы.
+    with use_primary():
+        versions = await recipe_versions([RECIPE_GENERATION_KEY])
+        # Сериализатор проверяет флаги в цикле событий, без обращений к кэшу.
+        await amemberships_for(drf_request)
+        filterset = RecipeFilter(
+            request.GET,
+            queryset=Recipe.objects.with_related(),
+            request=drf_request,
+        )
+        # Проверка tags и author обращается к БД.
+        if not await sync_to_async(filterset.is_valid)():
+            return None
+        queryset = filterset.qs
+        paginator = LimitOffsetPagination()
+        paginator.request = drf_request
+        paginator.limit = paginator.get_limit(drf_request)
+        paginator.offset = paginator.get_offset(drf_request)
+        paginator.count = await queryset.acount()
+        recipes = []
+        if paginator.count and paginator.offset < paginator.count:
+            recipes = [
+                recipe async for recipe in
+                queryset[paginator.offset:paginator.offset + paginator.limit]
+            ]
+        serializer = ReadRecipeSerializer(
+            recipes, many=True, context={"request": drf_request}
+        )
+        data = paginator.get_paginated_response(serializer.data).data
+        await store_recipe_response(key, data, versions,
+                                    settings.RECIPE_LIST_CACHE_TIMEOUT)
+        return JSONResponse(data)
+
+
+async def recipe_detail(request, user, pk):
+    key = recipe_detail_key(request, pk)
+    drf_request = get_drf_request(request, user)
+    response = await cached_recipe_response(key, drf_request)
+    if response is not None:
+        return response
+    with use_primary():
+        versions = await recipe_versions([RECIPE_VERSION_KEY.format(pk)])
+        await amemberships_for(drf_request)
+        recipe = await Recipe.objects.with_related().filter(pk=pk).afirst()
+        if recipe is None:
+            return None
+        data = ReadRecipeSerializer(
+            recipe, context={"request": drf_request}
+        ).data
+        await store_recipe_response(key, data, versions,
+                                    settings.RECIPE_DETAIL_CACHE_TIMEOUT)
+        return JSONResponse(data)
+
+
+recipe_list_view = async_read_view(
+    RecipeViewSet.as_view(
+        {"get": "list", "post": "create"}, basename="recipes", detail=False
+    ),
+    recipe_list,
+    accepts=lambda request: recipe_list_key(request) is not None,
+)
+recipe_detail_view = async_read_view(
+    RecipeViewSet.as_view(
+        {
+            "get": "retrieve",
+            "put": "update",
+            "patch": "partial_update",
+            "delete": "destroy",
+        },
+        basename="recipes",
+        detail=True,
+    ),
+    recipe_detail,
+)
+tag_list_view = async_read_view(
+    TagsViewSet.as_view({"get": "list"}, basename="tags", detail=False),
+    tag_list,
+)
+ingredient_list_view = async_read_view(
+    IngredientsViewSet.as_view(
+        {"get": "list"}, basename="ingredients", detail=False
+    ),
+    ingredient_list,
+)
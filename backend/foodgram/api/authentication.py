@@ -0,0 +1,139 @@
+import copy
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from foodgram.db_router import use_primary
+
+AUTH_VERSION_KEY = "api:auth:user:{}"
+
+
+def _detached(token):
+    """Копия токена со своей копией пользователя: запросы не делят
+    между собой и с кэшем один изменяемый объект User."""
+    token = copy.copy(token)
+    token.user = copy.copy(token.user)
+    return token
+
+
+class TokenCache:
+    """Ограниченный LRU-кэш токенов с TTL в памяти процесса.
+
+    Рядом с токеном хранится версия пользователя из кэша Django; запись
+    действует, пока версия не сменилась (см. invalidate_user_tokens).
+    С общим кэшем (settings.SHARED_CACHE) выход и смена пароля сразу
+    видны всем процессам; с LocMemCache — только этому, а в остальных
+    отозванный токен живёт не дольше TOKEN_CACHE_TTL."""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[2] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        return _detached(entry[0]), entry[1]
+
+    def set(self, key, token, version):
+        token = _detached(token)
+        with self._lock:
+            self._entries[key] = (token, version, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache(
+    settings.TOKEN_CACHE_MAX_SIZE, settings.TOKEN_CACHE_TTL
+)
+
+
+def auth_version_key(user_id):
+    return AUTH_VERSION_KEY.format(user_id)
+
+
+def invalidate_user_tokens(user_id):
+    key = auth_version_key(user_id)
+    transaction.on_commit(lambda: cache.set(key, uuid.uuid4().hex, None))
+
+
+def get_cached_token(key):
+    entry = token_cache.get(key)
+    if entry is None:
+        return None
+    token, version = entry
+    if cache.get(auth_version_key(token.user_id)) != version:
+        token_cache.discard(key)
+        return None
+    return token
+
+
+async def aget_cached_token(key):
+    entry = token_cache.get(key)
+    if entry is None:
+        return None
+    token, version = entry
+    if await cache.aget(auth_version_key(token.user_id)) != version:
+        token_cache.discard(key)
+        return None
+    return token
+
+
+def remember_token(token):
+    version = cache.get_or_set(
+        auth_version_key(token.user_id), uuid.uuid4().hex, None
+    )
+    token_cache.set(token.key, token, version)
+
+
+async def aremember_token(token):
+    version = await cache.aget_or_set(
+        auth_version_key(token.user_id), uuid.uuid4().hex, None
+    )
+    token_cache.set(token.key, token, version)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса к БД для недавно виденных токенов."""
+
+    def authenticate_credentials(self, key):
+        token = get_cached_token(key)
+        if token is None:
+            try:
+                # Токен, только что выданный при входе, может ещё не
+                # дойти до реплики.
+                with use_primary():
+                    token = Token.objects.select_related("user").get(key=key)
+            except Token.DoesNotExist:
+                raise exceptions.AuthenticationFailed("Invalid token.")
+            if token.user.is_active:
+                remember_token(token)
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(
+                "User inactive or deleted."
+            )
+        return token.user, token
@@ -0,0 +1,242 @@
+import hashlib
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from foodgram.db_router import use_primary
+from recipes.memberships import memberships_for
+
+REFERENCE_CACHE_KEY = "api:reference:{}"
+RECIPE_VERSION_KEY = "api:recipe:{}:version"
+RECIPE_GENERATION_KEY = "api:recipes:generation"
+RECIPE_RESPONSE_KEY = "api:recipes:response:{}"
+CACHED_LIST_PARAMS = ("tags", "author", "limit", "offset")
+
+
+def reference_cache_key(name):
+    return REFERENCE_CACHE_KEY.format(name)
+
+
+def invalidate_reference(name):
+    cache.delete(reference_cache_key(name))
+
+
+def reference_cache_timeout():
+    """Сигналы сбрасывают LocMemCache только своего процесса, поэтому без
+    общего кэша запись в остальных живёт недолго."""
+    if settings.SHARED_CACHE:
+        return settings.REFERENCE_CACHE_TIMEOUT
+    return settings.REFERENCE_LOCAL_CACHE_TIMEOUT
+
+
+def make_reference_entry(data):
+    content = JSONRenderer().render(data)
+    return {
+        "data": data,
+        "etag": f'"{hashlib.md5(content).hexdigest()}"',
+        "last_modified": int(time.time()),
+    }
+
+
+def reference_response(request, entry, response_class=Response):
+    response = get_conditional_response(
+        request,
+        etag=entry["etag"],
+        last_modified=entry["last_modified"],
+    ) or response_class(entry["data"])
+    response["ETag"] = entry["etag"]
+    response["Last-Modified"] = http_date(entry["last_modified"])
+    response["Cache-Control"] = "no-cache"
+    return response
+
+
+class CachedReferenceListMixin:
+    """Кэширует сериализованный список справочника целиком и отдаёт его
+    с ETag/Last-Modified, чтобы клиент мог получить 304 вместо списка.
+
+    Кэш сбрасывается сигналами модели (см. api.signals); ETag и
+    Last-Modified берутся из сохранённой записи."""
+
+    reference_name = None
+
+    def get_reference_entry(self):
+        key = reference_cache_key(self.reference_name)
+        entry = cache.get(key)
+        if entry is None:
+            with use_primary():
+                entry = make_reference_entry(
+                    self.get_serializer(self.get_queryset(), many=True).data
+                )
+            cache.set(key, entry, reference_cache_timeout())
+        return entry
+
+    def list(self, request, *args, **kwargs):
+        return reference_response(request, self.get_reference_entry())
+
+
+def touch_recipes(recipe_ids, list_changed=False):
+    """Меняет версии рецептов, а при list_changed ещё и поколение списков.
+    Новая версия выставляется после коммита, когда данные уже видны."""
+    keys = [RECIPE_VERSION_KEY.format(pk) for pk in recipe_ids]
+    if list_changed:
+        keys.append(RECIPE_GENERATION_KEY)
+    if keys:
+        transaction.on_commit(
+            lambda: cache.set_many(dict.fromkeys(keys, uuid.uuid4().hex), None)
+        )
+
+
+def missing_versions(keys, versions):
+    return {key: uuid.uuid4().hex for key in keys if key not in versions}
+
+
+def get_versions(keys):
+    """Текущие версии по ключам; вытесненные из кэша заводятся заново."""
+    versions = cache.get_many(keys)
+    missing = missing_versions(keys, versions)
+    if missing:
+        cache.set_many(missing, None)
+    return {**versions, **missing}
+
+
+async def aget_versions(keys):
+    versions = await cache.aget_many(keys)
+    missing = missing_versions(keys, versions)
+    if missing:
+        await cache.aset_many(missing, None)
+    return {**versions, **missing}
+
+
+def recipe_version_keys(recipes):
+    return [RECIPE_VERSION_KEY.format(recipe["id"]) for recipe in recipes]
+
+
+def recipe_response_key(request, *parts):
+    raw = "|".join((request.scheme, request.get_host(), *parts))
+    return RECIPE_RESPONSE_KEY.format(hashlib.md5(raw.encode()).hexdigest())
+
+
+def recipe_list_key(request):
+    """Ключ списка по нормализованным tags, author, limit и offset;
+    None, если в запросе есть другие параметры."""
+    params = request.GET
+    if not set(params) <= set(CACHED_LIST_PARAMS):
+        return None
+    normalized = "&".join(
+        f"{name}={','.join(sorted(params.getlist(name)))}"
+        for name in CACHED_LIST_PARAMS
+        if name in params
+    )
+    return recipe_response_key(request, "list", normalized)
+
+
+def recipe_detail_key(request, pk):
+    return recipe_response_key(request, "detail", str(pk))
+
+
+def anonymize_recipe(recipe):
+    return {
+        **recipe,
+        "author": {**recipe["author"], "is_subscribed": False},
+        "is_favorited": False,
+        "is_in_shopping_cart": False,
+    }
+
+
+def anonymize(data):
+    if "results" in data:
+        return {
+            **data,
+            "results": [anonymize_recipe(item) for item in data["results"]],
+        }
+    return anonymize_recipe(data)
+
+
+def entry_recipes(data):
+    return data["results"] if "results" in data else [data]
+
+
+def apply_user_flags(data, memberships):
+    """Накладывает флаги пользователя на анонимную запись."""
+    overlaid = []
+    for recipe in entry_recipes(data):
+        overlaid.append({
+            **recipe,
+            "author": {
+                **recipe["author"],
+                "is_subscribed": recipe["author"]["id"] in memberships.follows,
+            },
+            "is_favorited": recipe["id"] in memberships.favorites,
+            "is_in_shopping_cart": recipe["id"] in memberships.cart,
+        })
+    if "results" in data:
+        return {**data, "results": overlaid}
+    return overlaid[0]
+
+
+class CachedRecipeResponseMixin:
+    """Кэширует ответы списка и карточки рецептов в анонимном виде.
+
+    Запись хранит версии попавших в неё рецептов и поколение списков и
+    считается устаревшей, как только любая из них сменилась (см.
+    api.signals). Авторизованному пользователю отдаётся та же запись, на
+    которую накладываются его флаги из recipes.memberships.
+
+    Версии хранятся в кэше Django, и смену версии в LocMemCache другие
+    процессы не увидят. Поэтому без общего кэша (settings.SHARED_CACHE)
+    ответы не кэшируются: каждый запрос сериализуется из БД."""
+
+    def list(self, request, *args, **kwargs):
+        key = recipe_list_key(request)
+        if key is None or not settings.SHARED_CACHE:
+            return super().list(request, *args, **kwargs)
+        return self.cached_response(
+            request, key, [RECIPE_GENERATION_KEY],
+            settings.RECIPE_LIST_CACHE_TIMEOUT,
+            super().list, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = str(kwargs.get(self.lookup_field, ""))
+        key = recipe_detail_key(request, pk)
+        if not settings.SHARED_CACHE or not pk.isdigit():
+            return super().retrieve(request, *args, **kwargs)
+        return self.cached_response(
+            request, key,
+            [RECIPE_VERSION_KEY.format(pk)],
+            settings.RECIPE_DETAIL_CACHE_TIMEOUT,
+            super().retrieve, *args, **kwargs
+        )
+
+    def cached_response(self, request, key, version_keys, timeout,
+                        render, *args, **kwargs):
+        entry = cache.get(key)
+        if entry is not None and (
+            cache.get_many(entry["versions"]) == entry["versions"]
+        ):
+            data = entry["data"]
+            if request.user.is_authenticated:
+                data = apply_user_flags(
+                    data, memberships_for(request).load()
+                )
+            return Response(data)
+        # Версии, известные до выборки, читаются до неё: изменение,
+        # закоммиченное во время выборки, сделает запись устаревшей.
+        versions = get_versions(version_keys)
+        with use_primary():
+            response = render(request, *args, **kwargs)
+        if response.status_code == 200:
+            data = anonymize(response.data)
+            versions = {
+                **get_versions(recipe_version_keys(entry_recipes(data))),
+                **versions,
+            }
+            cache.set(key, {"data": data, "versions": versions}, timeout)
+        return response
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches, Tags.database)
+def check_replicas_cache(app_configs, **kwargs):
+    """Реплики без общего кэша не используются (см. ReadReplicaMiddleware):
+    закрепление за основной базой после записи не дойдёт до других
+    процессов."""
+    if settings.DATABASE_REPLICAS and not settings.SHARED_CACHE:
+        return [
+            Warning(
+                "DB_REPLICA_HOSTS задан, но кэш не общий: все запросы "
+                "идут в основную базу.",
+                hint="Задайте REDIS_URL.",
+                id="api.W001",
+            )
+        ]
+    return []
@@ -0,0 +1,52 @@
+import binascii
+from tempfile import SpooledTemporaryFile
+
+import filetype
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from drf_extra_fields.fields import Base64FieldMixin, Base64ImageField
+from rest_framework.exceptions import ValidationError
+
+BASE64_CHUNK_SIZE = 64 * 1024
+
+
+class StreamingBase64ImageField(Base64ImageField):
+    """Base64ImageField, который проверяет размер картинки до
+    декодирования и декодирует base64 порциями во временный файл,
+    не создавая в памяти вторую полную копию изображения."""
+
+    def to_internal_value(self, base64_data):
+        if base64_data in self.EMPTY_VALUES:
+            return None
+        if not isinstance(base64_data, str):
+            return super().to_internal_value(base64_data)
+        if ";base64," in base64_data:
+            base64_data = base64_data.split(";base64,", 1)[1]
+        if len(base64_data) * 3 // 4 > settings.RECIPE_IMAGE_MAX_SIZE:
+            raise ValidationError(
+                "Размер картинки не должен превышать "
+                f"{settings.RECIPE_IMAGE_MAX_SIZE // (1024 * 1024)} МБ."
+            )
+        decoded_file = SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+        )
+        try:
+            for start in range(0, len(base64_data), BASE64_CHUNK_SIZE):
+                decoded_file.write(binascii.a2b_base64(
+                    base64_data[start:start + BASE64_CHUNK_SIZE]
+                ))
+        except binascii.Error:
+            raise ValidationError(self.INVALID_FILE_MESSAGE)
+        size = decoded_file.tell()
+        decoded_file.seek(0)
+        extension = filetype.guess_extension(decoded_file.read(261))
+        decoded_file.seek(0)
+        extension = "jpg" if extension == "jpeg" else extension
+        if extension not in self.ALLOWED_TYPES:
+            raise ValidationError(self.INVALID_TYPE_MESSAGE)
+        data = UploadedFile(
+            file=decoded_file,
+            name=f"{self.get_file_name(None)}.{extension}",
+            size=size,
+        )
+        return super(Base64FieldMixin, self).to_internal_value(data)
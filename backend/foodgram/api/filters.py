@@ -1,14 +1,8 @@
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import FilterSet, filters
 
-from recipes.models import Ingredient, Recipe, Tag, User
-
-
-class IngredientSearchFilter(FilterSet):
-    name = filters.CharFilter(lookup_expr="startswith")
-
-    class Meta:
-        model = Ingredient
-        fields = ("name",)
+from recipes.models import Recipe, RecipeTags, Tag, User
+from recipes.search import search_recipes
 
 
 class RecipeFilter(FilterSet):
@@ -20,12 +14,16 @@ class RecipeFilter(FilterSet):
         field_name="tags__slug",
         to_field_name="slug",
         queryset=Tag.objects.all(),
+        method="get_tags",
     )
     author = filters.ModelChoiceFilter(queryset=User.objects.all())
+    search = filters.CharFilter(method="get_search")
 
     class Meta:
         model = Recipe
-        fields = ("is_favorited", "is_in_shopping_cart", "tags", "author")
+        fields = (
+            "is_favorited", "is_in_shopping_cart", "tags", "author", "search"
+        )
 
     def get_is_favorited(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
@@ -40,3 +38,13 @@ class RecipeFilter(FilterSet):
                 shopping_cart_recipe__user=self.request.user
             )
         return queryset
+
+    def get_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        return queryset.filter(Exists(
+            RecipeTags.objects.filter(recipe=OuterRef("pk"), tag__in=value)
+        ))
+
+    def get_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
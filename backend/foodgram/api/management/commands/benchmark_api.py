@@ -0,0 +1,386 @@
+import base64
+import io
+import random
+import statistics
+import tempfile
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import (
+    CaptureQueriesContext,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+from PIL import Image
+from api.authentication import token_cache
+from recipes.counters import rebuild_counters
+from recipes.feed import rebuild_feeds
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredients,
+    RecipeTags,
+    ShoppingCart,
+    Tag,
+)
+from recipes.search import update_search_vectors
+from rest_framework.authtoken.models import Token
+from users.models import CustomUser, Follow
+
+BATCH_SIZE = 5000
+INGREDIENTS_PER_RECIPE = 5
+TAGS_PER_RECIPE = 2
+FAVORITES_PER_USER = 20
+CART_PER_USER = 10
+FOLLOWS_PER_USER = 10
+
+# Маршрут -> бюджет SQL-запросов на холодных кэшах (пустые общий кэш и
+# кэш токенов) и на тёплых, включая запрос токена при аутентификации.
+# {recipe}, {author} и {ingredients} подставляются из данных.
+READ_BUDGETS = (
+    ("/api/recipes/", 8, 0),
+    ("/api/recipes/?limit=6&offset=4000", 8, 0),
+    ("/api/recipes/?pagination=cursor", 7, 3),
+    ("/api/recipes/?tags=breakfast&tags=dinner", 9, 0),
+    ("/api/recipes/?author={author}", 9, 0),
+    ("/api/recipes/?is_favorited=1", 8, 4),
+    ("/api/recipes/?is_in_shopping_cart=1", 8, 4),
+    ("/api/recipes/?search=рецепт 42", 8, 4),
+    ("/api/recipes/{recipe}/", 7, 0),
+    ("/api/recipes/feed/", 8, 4),
+    ("/api/recipes/what_can_i_cook/?ingredients={ingredients}", 2, 1),
+    ("/api/recipes/download_shopping_cart/", 2, 1),
+    ("/api/users/", 4, 2),
+    ("/api/users/{author}/", 3, 1),
+    ("/api/users/me/", 2, 0),
+    ("/api/users/subscriptions/?recipes_limit=3", 4, 3),
+    ("/api/tags/", 2, 0),
+    ("/api/ingredients/", 2, 0),
+    ("/api/ingredients/?name=мол", 1, 0),
+)
+
+# Запись: (метод, маршрут, тело запроса, бюджет). Запросы идут парами,
+# которые возвращают данные в исходное состояние; {created} — рецепт,
+# созданный предыдущим POST /api/recipes/.
+WRITE_BUDGETS = (
+    ("post", "/api/recipes/{recipe}/favorite/", None, 5),
+    ("delete", "/api/recipes/{recipe}/favorite/", None, 6),
+    ("post", "/api/recipes/{recipe}/shopping_cart/", None, 5),
+    ("delete", "/api/recipes/{recipe}/shopping_cart/", None, 6),
+    ("post", "/api/recipes/favorite/batch/", "batch", 6),
+    ("delete", "/api/recipes/favorite/batch/", "batch", 7),
+    ("post", "/api/recipes/shopping_cart/batch/", "batch", 6),
+    ("delete", "/api/recipes/shopping_cart/batch/", "batch", 7),
+    ("post", "/api/users/{stranger}/subscribe/", None, 17),
+    ("delete", "/api/users/{stranger}/subscribe/", None, 8),
+    ("post", "/api/recipes/", "recipe", 28),
+    ("patch", "/api/recipes/{created}/", "recipe", 22),
+    ("delete", "/api/recipes/{created}/", None, 16),
+)
+BATCH_RECIPES = 20
+
+
+def bulk_create(model, objects):
+    model.objects.bulk_create(objects, batch_size=BATCH_SIZE)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный прогон API на синтетических данных с проверкой "
+        "бюджета SQL-запросов. Работает на отдельной тестовой базе."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=2000)
+        parser.add_argument("--recipes", type=int, default=100000)
+        parser.add_argument("--ingredients", type=int, default=2000)
+        parser.add_argument("--iterations", type=int, default=50)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--keepdb",
+            action="store_true",
+            help="Не пересоздавать тестовую базу и данные между прогонами",
+        )
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_config = setup_databases(
+            verbosity=0, interactive=False, keepdb=options["keepdb"]
+        )
+        try:
+            if not (options["keepdb"] and Recipe.objects.exists()):
+                self.seed(options)
+            failures = self.run_benchmark(options["iterations"])
+        finally:
+            teardown_databases(
+                old_config, verbosity=0, keepdb=options["keepdb"]
+            )
+            teardown_test_environment()
+        if failures:
+            raise CommandError(
+                "Превышен бюджет запросов: " + ", ".join(failures)
+            )
+        self.stdout.write(self.style.SUCCESS("Все маршруты в бюджете"))
+
+    def seed(self, options):
+        rng = random.Random(options["seed"])
+        start = time.perf_counter()
+        password = make_password("benchmark")
+        bulk_create(CustomUser, [
+            CustomUser(
+                username=f"user{i}",
+                email=f"user{i}@example.com",
+                first_name="Имя",
+                last_name="Фамилия",
+                password=password,
+            )
+            for i in range(options["users"])
+        ])
+        bulk_create(Tag, [
+            Tag(name=slug, color=f"#{index:06x}", slug=slug)
+            for index, slug in enumerate(("breakfast", "lunch", "dinner"))
+        ])
+        bulk_create(Ingredient, [
+            Ingredient(name=f"ингредиент {i}", measurement_unit="г")
+            for i in range(options["ingredients"])
+        ])
+        Ingredient.objects.bulk_create(
+            [Ingredient(name="молоко", measurement_unit="мл")],
+            ignore_conflicts=True,
+        )
+        user_ids = list(CustomUser.objects.values_list("id", flat=True))
+        tag_ids = list(Tag.objects.values_list("id", flat=True))
+        ingredient_ids = list(Ingredient.objects.values_list("id", flat=True))
+        bulk_create(Recipe, [
+            Recipe(
+                author_id=rng.choice(user_ids),
+                name=f"Рецепт {i}",
+                text="Описание рецепта",
+                image="recipes/benchmark.png",
+                cooking_time=rng.randint(1, 100),
+            )
+            for i in range(options["recipes"])
+        ])
+        recipe_ids = list(Recipe.objects.values_list("id", flat=True))
+        bulk_create(RecipeIngredients, [
+            RecipeIngredients(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=rng.randint(1, 100),
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in rng.sample(
+                ingredient_ids, INGREDIENTS_PER_RECIPE
+            )
+        ])
+        bulk_create(RecipeTags, [
+            RecipeTags(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in rng.sample(tag_ids, TAGS_PER_RECIPE)
+        ])
+        for model, per_user in (
+            (Favorite, FAVORITES_PER_USER),
+            (ShoppingCart, CART_PER_USER),
+        ):
+            bulk_create(model, [
+                model(user_id=user_id, recipe_id=recipe_id)
+                for user_id in user_ids
+                for recipe_id in rng.sample(recipe_ids, per_user)
+            ])
+        bulk_create(Follow, [
+            Follow(user_id=user_id, author_id=author_id)
+            for user_id in user_ids
+            for author_id in rng.sample(user_ids, FOLLOWS_PER_USER)
+            if author_id != user_id
+        ])
+        rebuild_counters()
+        rebuild_feeds()
+        update_search_vectors(Recipe.objects.all())
+        self.stdout.write(
+            f"Данные сгенерированы за {time.perf_counter() - start:.1f} с"
+        )
+
+    @staticmethod
+    def clear_caches():
+        cache.clear()
+        token_cache.clear()
+
+    @staticmethod
+    def measure(client, method, url, payload=None):
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            if payload is None:
+                response = getattr(client, method)(url)
+            else:
+                response = getattr(client, method)(
+                    url, payload, content_type="application/json"
+                )
+            if response.streaming:
+                b"".join(response.streaming_content)
+            elapsed = (time.perf_counter() - start) * 1000
+        return response, elapsed, len(context)
+
+    def get_params(self, user):
+        listed = set(
+            Favorite.objects.filter(user=user).values_list(
+                "recipe_id", flat=True
+            )
+        ) | set(
+            ShoppingCart.objects.filter(user=user).values_list(
+                "recipe_id", flat=True
+            )
+        )
+        free_recipes = list(
+            Recipe.objects.exclude(pk__in=listed).values_list(
+                "id", flat=True
+            )[:BATCH_RECIPES + 1]
+        )
+        followed = Follow.objects.filter(user=user).values_list(
+            "author_id", flat=True
+        )
+        return {
+            "recipe": free_recipes[0],
+            "batch": free_recipes[1:],
+            "author": followed.first(),
+            "stranger": CustomUser.objects.exclude(pk=user.pk)
+            .exclude(pk__in=followed).values_list("id", flat=True).first(),
+            "ingredients": ",".join(
+                str(pk) for pk in Ingredient.objects.values_list(
+                    "id", flat=True
+                )[:INGREDIENTS_PER_RECIPE]
+            ),
+        }
+
+    def get_payloads(self, params):
+        image = io.BytesIO()
+        Image.new("RGB", (64, 48), "orange").save(image, "PNG")
+        return {
+            "batch": {"recipes": params["batch"]},
+            "recipe": {
+                "name": "Рецепт для замера",
+                "text": "Описание рецепта",
+                "cooking_time": 10,
+                "image": "data:image/png;base64,"
+                + base64.b64encode(image.getvalue()).decode(),
+                "tags": list(Tag.objects.values_list("id", flat=True)[:1]),
+                "ingredients": [
+                    {"id": pk, "amount": 10}
+                    for pk in Ingredient.objects.values_list(
+                        "id", flat=True
+                    )[:INGREDIENTS_PER_RECIPE]
+                ],
+            },
+        }
+
+    def run_benchmark(self, iterations):
+        user = CustomUser.objects.order_by("id").first()
+        token, _ = Token.objects.get_or_create(user=user)
+        client = Client(HTTP_AUTHORIZATION=f"Token {token.key}")
+        params = self.get_params(user)
+        # Прогон идёт в одном процессе, и его LocMemCache общий для всех
+        # запросов, как Redis в рабочей конфигурации.
+        with override_settings(SHARED_CACHE=True):
+            failures = self.run_reads(client, params, iterations)
+        # Картинки созданных рецептов пишутся во временный каталог.
+        with tempfile.TemporaryDirectory() as media_root:
+            with override_settings(MEDIA_ROOT=media_root, SHARED_CACHE=True):
+                failures += self.run_writes(client, params, iterations)
+        return failures
+
+    def run_reads(self, client, params, iterations):
+        self.stdout.write(
+            f"{'route':60} {'cold ms':>8} {'p50 ms':>8} {'p95 ms':>8} "
+            f"{'p99 ms':>8} {'queries':>8} {'budget':>8}"
+        )
+        failures = []
+        for route, cold_budget, warm_budget in READ_BUDGETS:
+            url = route.format(**params)
+            cold_timings = []
+            timings = []
+            cold_queries = queries = 0
+            # Прогревочный запрос строит индексы в памяти процесса: они
+            # живут, пока процесс не перезапущен, и в бюджет не входят.
+            client.get(url)
+            for _ in range(iterations):
+                self.clear_caches()
+                response, elapsed, count = self.measure(client, "get", url)
+                cold_timings.append(elapsed)
+                cold_queries = max(cold_queries, count)
+                if response.status_code != 200:
+                    failures.append(f"{url} ({response.status_code})")
+                    break
+                response, elapsed, count = self.measure(client, "get", url)
+                timings.append(elapsed)
+                queries = max(queries, count)
+            over_budget = cold_queries > cold_budget or queries > warm_budget
+            if over_budget:
+                failures.append(
+                    f"{url} ({cold_queries}/{queries} > "
+                    f"{cold_budget}/{warm_budget})"
+                )
+            line = (
+                f"{url:60} {statistics.median(cold_timings):8.2f} "
+                f"{statistics.median(timings or cold_timings):8.2f} "
+                f"{percentile(timings or cold_timings, 0.95):8.2f} "
+                f"{percentile(timings or cold_timings, 0.99):8.2f} "
+                f"{f'{cold_queries}/{queries}':>8} "
+                f"{f'{cold_budget}/{warm_budget}':>8}"
+            )
+            self.stdout.write(
+                self.style.ERROR(line) if over_budget else line
+            )
+        return failures
+
+    def run_writes(self, client, params, iterations):
+        self.stdout.write(
+            f"{'request':60} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+            f"{'queries':>8} {'budget':>8}"
+        )
+        payloads = self.get_payloads(params)
+        results = {request: ([], 0) for request in WRITE_BUDGETS}
+        failures = []
+        for _ in range(iterations):
+            for request in WRITE_BUDGETS:
+                method, route, payload, budget = request
+                url = route.format(**params)
+                response, elapsed, count = self.measure(
+                    client, method, url, payloads.get(payload)
+                )
+                if not 200 <= response.status_code < 300:
+                    failures.append(
+                        f"{method.upper()} {url} ({response.status_code})"
+                    )
+                    return failures
+                if method == "post" and route == "/api/recipes/":
+                    params["created"] = response.json()["id"]
+                timings, queries = results[request]
+                timings.append(elapsed)
+                results[request] = (timings, max(queries, count))
+        for request, (timings, queries) in results.items():
+            method, route, _, budget = request
+            name = f"{method.upper()} {route}"
+            over_budget = queries > budget
+            if over_budget:
+                failures.append(f"{name} ({queries} > {budget})")
+            line = (
+                f"{name:60} {statistics.median(timings):8.2f} "
+                f"{percentile(timings, 0.95):8.2f} "
+                f"{percentile(timings, 0.99):8.2f} "
+                f"{queries:8} {budget:8}"
+            )
+            self.stdout.write(
+                self.style.ERROR(line) if over_budget else line
+            )
+        return failures
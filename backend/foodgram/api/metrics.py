@@ -0,0 +1,116 @@
+import threading
+from collections import defaultdict
+
+METRIC_FIELDS = (
+    ("requests_total", "counter", "Количество запросов"),
+    ("db_queries_total", "counter", "Количество SQL-запросов"),
+    ("db_seconds_total", "counter", "Время выполнения SQL, секунды"),
+    (
+        "serialize_seconds_total", "counter",
+        "Время сериализации ответа без SQL, секунды",
+    ),
+    ("render_seconds_total", "counter", "Время рендеринга ответа, секунды"),
+    ("request_seconds_total", "counter", "Полное время обработки, секунды"),
+    ("response_bytes_total", "counter", "Размер ответов, байты"),
+)
+
+
+class RequestMetrics:
+    """Накопительные метрики запросов в памяти процесса, с метками
+    view/action/method. Отдаются в текстовом формате Prometheus."""
+
+    prefix = "foodgram_"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = defaultdict(lambda: [0] * len(METRIC_FIELDS))
+        self._collectors = []
+
+    def add_collector(self, collect):
+        """collect() возвращает кортежи (имя, тип, описание, метки,
+        значение) для метрик, которые считаются не по запросам."""
+        self._collectors.append(collect)
+
+    def observe(self, labels, *values):
+        with self._lock:
+            series = self._series[labels]
+            for index, value in enumerate((1,) + values):
+                series[index] += value
+
+    def render(self):
+        with self._lock:
+            series = {labels: list(values)
+                      for labels, values in self._series.items()}
+        lines = []
+        for index, (name, kind, help_text) in enumerate(METRIC_FIELDS):
+            name = self.prefix + name
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for (view, action, method), values in sorted(series.items()):
+                lines.append(
+                    f'{name}{{view="{view}",action="{action}",'
+                    f'method="{method}"}} {values[index]}'
+                )
+        samples = defaultdict(list)
+        for collect in self._collectors:
+            for name, kind, help_text, labels, value in collect():
+                samples[(name, kind, help_text)].append((labels, value))
+        for (name, kind, help_text), values in samples.items():
+            name = self.prefix + name
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in values:
+                label_text = ",".join(
+                    f'{key}="{label}"' for key, label in labels.items()
+                )
+                lines.append(f"{name}{{{label_text}}} {value}")
+        return "\n".join(lines) + "\n"
+
+
+POOL_FIELDS = (
+    ("idle", "gauge", "Простаивающие соединения в пуле"),
+    ("in_use", "gauge", "Выданные из пула соединения"),
+    ("max_size", "gauge", "Предел соединений пула"),
+    ("created", "counter", "Открыто соединений пулом"),
+    ("checkouts", "counter", "Выдано соединений из пула"),
+    ("discarded", "counter", "Отброшено неисправных соединений"),
+    ("overflow", "counter", "Соединений сверх предела пула"),
+)
+
+
+class DatabaseMetrics:
+    """Подключения Django к базе и состояние пулов соединений."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._connections = defaultdict(int)
+
+    def connection_opened(self, alias):
+        with self._lock:
+            self._connections[alias] += 1
+
+    def __call__(self):
+        with self._lock:
+            connections = dict(self._connections)
+        for alias, count in sorted(connections.items()):
+            yield (
+                "db_connections_opened_total", "counter",
+                "Открыто соединений Django с базой",
+                {"database": alias}, count,
+            )
+        try:
+            from foodgram.pooled_postgresql.base import pool_stats
+        except ImportError:
+            return
+        for alias, stats in sorted(pool_stats().items()):
+            for field, kind, help_text in POOL_FIELDS:
+                suffix = "_total" if kind == "counter" else ""
+                yield (
+                    f"db_pool_{field}{suffix}", kind, help_text,
+                    {"database": alias}, stats[field],
+                )
+
+
+request_metrics = RequestMetrics()
+database_metrics = DatabaseMetrics()
+request_metrics.add_collector(database_metrics)
@@ -0,0 +1,232 @@
+import hashlib
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from rest_framework.permissions import SAFE_METHODS
+
+from api.metrics import database_metrics, request_metrics
+from foodgram.db_router import replica_reads
+
+PRIMARY_PIN_KEY = "db:primary-pin:{}"
+
+# Счётчик текущего запроса. Контекст копируется в потоки sync_to_async,
+# поэтому запросы асинхронного ORM попадают в тот же счётчик.
+current_counter = ContextVar("current_counter", default=None)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.serialize_duration = 0.0
+        self._serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+    @contextmanager
+    def serializing(self):
+        """Время сериализации за вычетом SQL внутри неё. Вложенные вызовы
+        .data (to_representation через другой сериализатор) входят во
+        внешний и отдельно не считаются."""
+        if self._serializing:
+            yield
+            return
+        self._serializing = True
+        start, db_duration = time.perf_counter(), self.duration
+        try:
+            yield
+        finally:
+            self._serializing = False
+            self.serialize_duration += (
+                time.perf_counter() - start - (self.duration - db_duration)
+            )
+
+
+def measure_serialization():
+    counter = current_counter.get()
+    return nullcontext() if counter is None else counter.serializing()
+
+
+def count_query(execute, sql, params, many, context):
+    counter = current_counter.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+    return counter(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_query_counter(sender, connection, **kwargs):
+    # Соединения привязаны к потоку, поэтому обёртка ставится на каждое.
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+    database_metrics.connection_opened(connection.alias)
+
+
+class RequestMetricsMiddleware:
+    """Считает SQL-запросы, время БД, сериализации, рендеринга и размер
+    ответа для каждого запроса. Результат уходит в заголовок
+    Server-Timing и в метрики процесса с метками viewset/action."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.REQUEST_METRICS_ENABLED:
+            return self.get_response(request)
+        counter = QueryCounter()
+        start = self.start(request)
+        token = current_counter.set(counter)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_counter.reset(token)
+        return self.finish(request, response, counter, start)
+
+    async def __acall__(self, request):
+        if not settings.REQUEST_METRICS_ENABLED:
+            return await self.get_response(request)
+        counter = QueryCounter()
+        start = self.start(request)
+        token = current_counter.set(counter)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_counter.reset(token)
+        return self.finish(request, response, counter, start)
+
+    def start(self, request):
+        request.metrics_render_time = 0.0
+        return time.perf_counter()
+
+    def finish(self, request, response, counter, start):
+        duration = time.perf_counter() - start
+        size = 0 if response.streaming else len(response.content)
+        labels = (
+            getattr(request, "metrics_view", "unresolved"),
+            getattr(request, "metrics_action", "unresolved"),
+            request.method,
+        )
+        request_metrics.observe(
+            labels,
+            counter.count,
+            counter.duration,
+            counter.serialize_duration,
+            request.metrics_render_time,
+            duration,
+            size,
+        )
+        app_duration = (
+            duration - counter.duration - counter.serialize_duration
+        )
+        response["Server-Timing"] = ", ".join((
+            f'db;dur={counter.duration * 1000:.2f};'
+            f'desc="{counter.count} queries"',
+            f"serialize;dur={counter.serialize_duration * 1000:.2f}",
+            f"render;dur={request.metrics_render_time * 1000:.2f}",
+            f"app;dur={app_duration * 1000:.2f}",
+            f"total;dur={duration * 1000:.2f}",
+        ))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, "cls", None)
+        actions = getattr(view_func, "actions", None) or {}
+        request.metrics_view = (
+            view_class.__name__ if view_class else view_func.__name__
+        )
+        request.metrics_action = actions.get(
+            request.method.lower(), request.method.lower()
+        )
+
+    def process_template_response(self, request, response):
+        start = time.perf_counter()
+
+        def finish_render(rendered):
+            request.metrics_render_time = time.perf_counter() - start
+
+        response.add_post_render_callback(finish_render)
+        return response
+
+
+class ReadReplicaMiddleware:
+    """Включает чтение с реплик для запросов с безопасными методами.
+
+    После записи клиент на READ_YOUR_WRITES_WINDOW секунд закрепляется
+    за основной базой, чтобы сразу увидеть свои изменения. Клиент
+    определяется по заголовку Authorization; анонимные запросы не
+    закрепляются."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        key = self.pin_key(request)
+        safe = request.method in SAFE_METHODS
+        token = replica_reads.set(
+            self.uses_replicas() and safe
+            and not (key and cache.get(key))
+        )
+        try:
+            response = self.get_response(request)
+        finally:
+            replica_reads.reset(token)
+        if key and not safe:
+            cache.set(key, True, settings.READ_YOUR_WRITES_WINDOW)
+        return response
+
+    async def __acall__(self, request):
+        key = self.pin_key(request)
+        safe = request.method in SAFE_METHODS
+        token = replica_reads.set(
+            self.uses_replicas() and safe
+            and not (key and await cache.aget(key))
+        )
+        try:
+            response = await self.get_response(request)
+        finally:
+            replica_reads.reset(token)
+        if key and not safe:
+            await cache.aset(key, True, settings.READ_YOUR_WRITES_WINDOW)
+        return response
+
+    @staticmethod
+    def uses_replicas():
+        # Закрепление за основной базой хранится в кэше и без общего
+        # кэша не дойдёт до других процессов.
+        return bool(settings.DATABASE_REPLICAS) and settings.SHARED_CACHE
+
+    def pin_key(self, request):
+        if not self.uses_replicas():
+            return None
+        auth = request.headers.get("Authorization")
+        if not auth:
+            return None
+        return PRIMARY_PIN_KEY.format(
+            hashlib.md5(auth.encode()).hexdigest()
+        )
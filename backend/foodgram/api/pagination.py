@@ -0,0 +1,167 @@
+import base64
+import datetime
+import json
+from collections import OrderedDict
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Курсорная пагинация по полному ключу сортировки выборки.
+
+    Ключ берётся из order_by() выборки или из Meta.ordering модели, и в
+    курсор попадают значения всех его полей, например (pub_date, id).
+    Страница выбирается условием «ключ меньше курсора» без OFFSET даже
+    при одинаковых pub_date, поэтому последняя страница стоит столько же,
+    сколько первая. Последнее поле ключа должно быть уникальным."""
+
+    cursor_query_param = "cursor"
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = "limit"
+    max_page_size = 100
+    invalid_cursor_message = "Invalid cursor"
+
+    @staticmethod
+    def get_ordering(queryset):
+        """Поля ключа или None, если сортировка не по именам полей
+        (например, по выражению Case в поиске)."""
+        ordering = (
+            tuple(queryset.query.order_by) or queryset.model._meta.ordering
+        )
+        if not ordering or not all(
+            isinstance(field, str) and field != "?" for field in ordering
+        ):
+            return None
+        return ordering
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def encode_cursor(self, values, reverse):
+        data = {
+            "p": [
+                value.isoformat()
+                if isinstance(value, datetime.datetime) else value
+                for value in values
+            ],
+            "r": reverse,
+        }
+        cursor = base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, cursor
+        )
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            values, reverse = data["p"], bool(data["r"])
+        except (TypeError, ValueError, KeyError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    @staticmethod
+    def after(ordering, values):
+        """Условие «строка идёт после позиции values» для ключа ordering:
+        (a < x) OR (a = x AND b < y) OR ... с учётом направления полей."""
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, values):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            condition |= equal & Q(**{f"{name}__{lookup}": value})
+            equal &= Q(**{name: value})
+        return condition
+
+    @staticmethod
+    def reverse_ordering(ordering):
+        return tuple(
+            field[1:] if field.startswith("-") else f"-{field}"
+            for field in ordering
+        )
+
+    def position(self, obj):
+        return [getattr(obj, field.lstrip("-")) for field in self.ordering]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.ordering = self.get_ordering(queryset)
+        if self.ordering is None:
+            raise NotFound(self.invalid_cursor_message)
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        values, reverse = self.decode_cursor(request)
+        ordering = self.ordering
+        if reverse:
+            ordering = self.reverse_ordering(ordering)
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self.after(ordering, values))
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+        self.has_next = has_more if not reverse else True
+        self.has_previous = values is not None if not reverse else has_more
+        self.page = results
+        return results
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            # Пустая страница назад от курсора: вперёд — с начала.
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.position(self.page[-1]), False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.position(self.page[0]), True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict((
+            ("next", self.get_next_link()),
+            ("previous", self.get_previous_link()),
+            ("results", data),
+        )))
+
+
+class LimitOffsetOrCursorPagination(LimitOffsetPagination):
+    """limit/offset по умолчанию; курсорный режим включается параметром
+    ?pagination=cursor или наличием ?cursor= в запросе. Если выборка
+    отсортирована не по полям (поиск по релевантности на SQLite),
+    курсорный режим игнорируется."""
+
+    mode_query_param = "pagination"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if (
+            request.query_params.get(self.mode_query_param) == "cursor"
+            or KeysetPagination.cursor_query_param in request.query_params
+        ) and KeysetPagination.get_ordering(queryset) is not None:
+            self.keyset = KeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -1,11 +1,17 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import check_password
 from django.contrib.auth.password_validation import validate_password
+from django.db import transaction
 from djoser.serializers import UserCreateSerializer
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
+from rest_framework.authtoken.models import Token
 from rest_framework.validators import UniqueTogetherValidator
 
+from api.fields import StreamingBase64ImageField
+from api.middleware import measure_serialization
+from recipes.images import schedule_variants
+from recipes.memberships import memberships_for
 from recipes.models import (
     Favorite,
     Ingredient,
@@ -19,6 +25,21 @@ from users.models import Follow
 User = get_user_model()
 
 
+class TimedDataMixin:
+    """Время .data попадает в метрику serialize текущего запроса
+    (см. api.middleware.RequestMetricsMiddleware)."""
+
+    @property
+    def data(self):
+        with measure_serialization():
+            return super().data
+
+
+class TimedListSerializer(TimedDataMixin, serializers.ListSerializer):
+    """Список сериализаторов ответа: many=True через
+    Meta.list_serializer_class."""
+
+
 class SetPasswordSerializer(serializers.Serializer):
     current_password = serializers.CharField(required=True)
     new_password = serializers.CharField(required=True)
@@ -48,6 +69,9 @@ class SetPasswordSerializer(serializers.Serializer):
             new_password = validated_data.get("new_password")
             user.set_password(new_password)
             user.save()
+            # Старые токены отзываются, как при выходе; клиент входит
+            # заново с новым паролем.
+            Token.objects.filter(user=user).delete()
             return validated_data
 
 
@@ -57,7 +81,7 @@ class ProfileForRepresentationSerializer(serializers.ModelSerializer):
         fields = ("email", "id", "username", "first_name", "last_name")
 
 
-class ProfileReadSerializer(serializers.ModelSerializer):
+class ProfileReadSerializer(TimedDataMixin, serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
@@ -69,17 +93,13 @@ class ProfileReadSerializer(serializers.ModelSerializer):
                   "last_name",
                   "is_subscribed"
                   )
+        list_serializer_class = TimedListSerializer
 
     def get_is_subscribed(self, obj):
-        request = self.context.get("request")
-        return (
-            request
-            and request.user.is_authenticated
-            and Follow.objects.filter(user=request.user, author=obj).exists()
-        )
+        return obj.id in memberships_for(self.context.get("request")).follows
 
 
-class ProfileCreateSerializer(UserCreateSerializer):
+class ProfileCreateSerializer(TimedDataMixin, UserCreateSerializer):
     is_subscribed = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
@@ -100,15 +120,10 @@ class ProfileCreateSerializer(UserCreateSerializer):
         ).data
 
     def get_is_subscribed(self, obj):
-        request = self.context.get("request")
-        return (
-            request
-            and request.user.is_authenticated
-            and Follow.objects.filter(user=request.user, author=obj).exists()
-        )
+        return obj.id in memberships_for(self.context.get("request")).follows
 
 
-class ProfileSerializer(UserCreateSerializer):
+class ProfileSerializer(TimedDataMixin, UserCreateSerializer):
     is_subscribed = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
@@ -129,15 +144,10 @@ class ProfileSerializer(UserCreateSerializer):
         ).data
 
     def get_is_subscribed(self, obj):
-        request = self.context.get("request")
-        return (
-            request
-            and request.user.is_authenticated
-            and Follow.objects.filter(user=request.user, author=obj).exists()
-        )
+        return obj.id in memberships_for(self.context.get("request")).follows
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedDataMixin, serializers.ModelSerializer):
     class Meta:
         model = Ingredient
         fields = (
@@ -145,9 +155,10 @@ class IngredientSerializer(serializers.ModelSerializer):
             "name",
             "measurement_unit",
         )
+        list_serializer_class = TimedListSerializer
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedDataMixin, serializers.ModelSerializer):
     class Meta:
         model = Tag
         fields = (
@@ -156,6 +167,7 @@ class TagSerializer(serializers.ModelSerializer):
             "color",
             "slug",
         )
+        list_serializer_class = TimedListSerializer
 
 
 class AddIngredientSerializer(serializers.ModelSerializer):
@@ -167,10 +179,10 @@ class AddIngredientSerializer(serializers.ModelSerializer):
         fields = ("id", "amount")
 
 
-class CreateRecipeSerializer(serializers.ModelSerializer):
+class CreateRecipeSerializer(TimedDataMixin, serializers.ModelSerializer):
     ingredients = AddIngredientSerializer(many=True)
     author = ProfileSerializer(read_only=True)
-    image = Base64ImageField()
+    image = StreamingBase64ImageField()
     tags = serializers.PrimaryKeyRelatedField(
         many=True,
         queryset=Tag.objects.all(),
@@ -205,6 +217,11 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 "Рецепт не может быть создан без картинки."
             )
+        ingredient_ids = [item["id"].id for item in ingredient_amount]
+        if len(ingredient_ids) != len(set(ingredient_ids)):
+            raise serializers.ValidationError(
+                "Ингредиенты в рецепте не должны повторяться."
+            )
         return data
 
     @staticmethod
@@ -220,6 +237,7 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
             )
         RecipeIngredients.objects.bulk_create(ingredient_list)
 
+    @transaction.atomic
     def create(self, validated_data):
         author = self.context.get("request").user
         tags = validated_data.pop("tags")
@@ -227,6 +245,7 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         recipe = Recipe.objects.create(author=author, **validated_data)
         recipe.tags.set(tags)
         self.create_ingredients(ingredients, recipe)
+        schedule_variants(recipe)
         return recipe
 
     def to_representation(self, instance):
@@ -234,15 +253,42 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
             instance, context={"request": self.context.get("request")}
         ).data
 
+    @staticmethod
+    def update_ingredients(ingredients, recipe):
+        """Сравнивает новые ингредиенты с сохранёнными и пишет только
+        разницу: новые строки, изменённые количества и удалённые."""
+        amounts = {item["id"].id: item["amount"] for item in ingredients}
+        to_update = []
+        to_delete = []
+        for row in RecipeIngredients.objects.filter(recipe=recipe):
+            amount = amounts.pop(row.ingredient_id, None)
+            if amount is None:
+                to_delete.append(row.id)
+            elif row.amount != amount:
+                row.amount = amount
+                to_update.append(row)
+        if to_delete:
+            RecipeIngredients.objects.filter(id__in=to_delete).delete()
+        if to_update:
+            RecipeIngredients.objects.bulk_update(to_update, ("amount",))
+        if amounts:
+            RecipeIngredients.objects.bulk_create(
+                RecipeIngredients(
+                    recipe=recipe, ingredient_id=ingredient_id, amount=amount
+                )
+                for ingredient_id, amount in amounts.items()
+            )
+
+    @transaction.atomic
     def update(self, instance, validated_data):
         tags = validated_data.pop("tags")
         ingredients = validated_data.pop("ingredients")
+        previous_image = instance.image.name
         instance = super().update(instance, validated_data)
-        instance.tags.clear()
         instance.tags.set(tags)
-        instance.ingredients.clear()
-        self.create_ingredients(recipe=instance, ingredients=ingredients)
-        instance.save
+        self.update_ingredients(ingredients, instance)
+        if instance.image.name != previous_image:
+            schedule_variants(instance)
         return instance
 
 
@@ -258,7 +304,7 @@ class IngredientAmountSerializer(serializers.ModelSerializer):
         fields = ("id", "name", "amount", "measurement_unit")
 
 
-class ReadRecipeSerializer(serializers.ModelSerializer):
+class ReadRecipeSerializer(TimedDataMixin, serializers.ModelSerializer):
     author = ProfileReadSerializer(read_only=True)
     ingredients = IngredientAmountSerializer(many=True,
                                              source="recipe_ingredients")
@@ -277,72 +323,80 @@ class ReadRecipeSerializer(serializers.ModelSerializer):
             "is_in_shopping_cart",
             "name",
             "image",
+            "thumbnail",
+            "image_webp",
             "text",
             "cooking_time",
+            "favorites_count",
         )
+        list_serializer_class = TimedListSerializer
+
+    def to_representation(self, instance):
+        # Все три множества одним обращением к кэшу до первого флага.
+        memberships_for(self.context.get("request")).load()
+        return super().to_representation(instance)
 
     def get_is_favorited(self, obj):
-        request = self.context.get("request")
-        return (
-            request
-            and request.user.is_authenticated
-            and Favorite.objects.filter(user=request.user,
-                                        recipe=obj.id).exists()
-        )
+        return obj.id in memberships_for(
+            self.context.get("request")
+        ).favorites
 
     def get_is_in_shopping_cart(self, obj):
-        request = self.context.get("request")
-        return (
-            request
-            and request.user.is_authenticated
-            and ShoppingCart.objects.filter(user=request.user,
-                                            recipe=obj.id).exists()
-        )
+        return obj.id in memberships_for(self.context.get("request")).cart
 
 
-class RecipeShortSerializer(serializers.ModelSerializer):
+class RecipeShortSerializer(TimedDataMixin, serializers.ModelSerializer):
     class Meta:
         model = Recipe
-        fields = ("id", "name", "image", "cooking_time")
+        fields = ("id", "name", "image", "thumbnail", "image_webp",
+                  "cooking_time")
+        list_serializer_class = TimedListSerializer
 
 
-class FavoriteSerializer(serializers.ModelSerializer):
+class MatchedRecipeSerializer(RecipeShortSerializer):
+    matched_count = serializers.IntegerField(read_only=True)
+    missing_count = serializers.IntegerField(read_only=True)
+
+    class Meta(RecipeShortSerializer.Meta):
+        fields = RecipeShortSerializer.Meta.fields + (
+            "matched_count",
+            "missing_count",
+        )
+
+
+class FavoriteSerializer(TimedDataMixin, serializers.ModelSerializer):
     class Meta:
         model = Favorite
         fields = ("user", "recipe")
 
-    def validate(self, data):
-        user = data["user"]
-        recipe = data["recipe"]
-        if Favorite.objects.filter(user=user).filter(recipe=recipe).exists():
-            raise serializers.ValidationError("this ricepe already exists!")
-        return data
-
     def to_representation(self, instance):
         return RecipeShortSerializer(
             instance.recipe, context={"request": self.context.get("request")}
         ).data
 
 
-class ShoppingCartSerializer(serializers.ModelSerializer):
+class ShoppingCartSerializer(TimedDataMixin, serializers.ModelSerializer):
     class Meta:
         model = ShoppingCart
         fields = ("user", "recipe")
 
-    def validate(self, data):
-        user = data["user"]
-        recipe = data["recipe"]
-        if ShoppingCart.objects.filter(user=user).filter(
-                recipe=recipe).exists():
-            return serializers.ValidationError("This ricepe already exists!")
-        return data
-
     def to_representation(self, instance):
         return RecipeShortSerializer(
             instance.recipe, context={"request": self.context.get("request")}
         ).data
 
 
+class RecipeBatchSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.RECIPE_BATCH_MAX_SIZE,
+    )
+
+    def validate_recipes(self, value):
+        return list(dict.fromkeys(value))
+
+
 class SubscribeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Follow
@@ -365,10 +419,10 @@ class SubscribeSerializer(serializers.ModelSerializer):
         return data
 
 
-class SubscribeResponseSerializer(serializers.ModelSerializer):
+class SubscribeResponseSerializer(TimedDataMixin, serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField(read_only=True)
     recipes = ReadRecipeSerializer(many=True, read_only=True)
-    recipes_count = serializers.SerializerMethodField(read_only=True)
+    recipes_count = serializers.ReadOnlyField()
 
     class Meta:
         model = User
@@ -384,34 +438,20 @@ class SubscribeResponseSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        request = self.context.get("request")
-        if request:
-            current_user = request.user
-            if current_user.is_authenticated:
-                return Follow.objects.filter(user=current_user,
-                                             author=obj).exists()
-
-        return False
+        return obj.id in memberships_for(self.context.get("request")).follows
 
-    def get_recipes_count(self, obj):
-        recipes = Recipe.objects.filter(author=obj)
-        return recipes.count()
 
+class SubscriptionSerializer(TimedDataMixin, serializers.ModelSerializer):
+    """Serializer для автора в ленте подписок.
 
-class SubscriptionSerializer(serializers.ModelSerializer):
-    """Serializer для модели Follow"""
+    Ожидает выборку из UserViewSet.get_subscriptions_queryset: рецепты уже
+    подгружены и ограничены recipes_limit в атрибуте limited_recipes."""
 
-    email = serializers.ReadOnlyField(source="author.email")
-    id = serializers.ReadOnlyField(source="author.id")
-    username = serializers.ReadOnlyField(source="author.username")
-    first_name = serializers.ReadOnlyField(source="author.first_name")
-    last_name = serializers.ReadOnlyField(source="author.last_name")
-    is_subscribed = serializers.SerializerMethodField()
+    is_subscribed = serializers.BooleanField(default=True, read_only=True)
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
-        model = Follow
+        model = User
         fields = (
             "email",
             "id",
@@ -422,37 +462,7 @@ class SubscriptionSerializer(serializers.ModelSerializer):
             "recipes",
             "recipes_count",
         )
-        validators = (
-            UniqueTogetherValidator(
-                queryset=Follow.objects.all(),
-                fields=("user", "author"),
-                message=("Вы уже подписаны на данного автора!"),
-            ),
-        )
-
-    def validate(self, data):
-        user = self.context["request"].user
-        author = data["author"]
-        if user.id == author.id:
-            raise serializers.ValidationError(
-                "Нельзя подписаться на самого себя!"
-            )
-        return data
-
-    def get_is_subscribed(self, obj):
-        user = self.context.get("request").user
-        if not user.is_anonymous:
-            return Follow.objects.filter(user=obj.user,
-                                         author=obj.author).exists()
-        return False
+        list_serializer_class = TimedListSerializer
 
     def get_recipes(self, obj):
-        request = self.context.get("request")
-        limit = request.GET.get("recipes_limit")
-        recipes = Recipe.objects.filter(author=obj.author)
-        if limit and limit.isdigit():
-            recipes = recipes[: int(limit)]
-        return RecipeShortSerializer(recipes, many=True).data
-
-    def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj.author).count()
+        return RecipeShortSerializer(obj.limited_recipes, many=True).data
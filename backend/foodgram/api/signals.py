@@ -0,0 +1,114 @@
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from api.authentication import invalidate_user_tokens, token_cache
+from api.cache import invalidate_reference, touch_recipes
+from recipes.events import recipes_changed
+from recipes.user_lists import batch_in_progress
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredients,
+    RecipeTags,
+    ShoppingCart,
+    Tag,
+)
+from recipes.signals import ingredients_imported
+from users.models import CustomUser
+
+# Поля пользователя, которые не показываются в карточке рецепта.
+USER_HIDDEN_FIELDS = {
+    "last_login", "password", "recipes_count", "followers_count",
+}
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags(sender, **kwargs):
+    invalidate_reference("tags")
+
+
+# Связи удаляются каскадом раньше post_delete, поэтому рецепты тэга и
+# ингредиента собираются до удаления.
+@receiver((post_save, pre_delete), sender=Tag)
+def invalidate_tag_recipes(sender, instance, **kwargs):
+    touch_recipes(
+        RecipeTags.objects.filter(tag=instance).values_list(
+            "recipe_id", flat=True
+        ),
+        list_changed=True,
+    )
+
+
+@receiver((post_save, post_delete, ingredients_imported), sender=Ingredient)
+def invalidate_ingredients(sender, **kwargs):
+    invalidate_reference("ingredients")
+
+
+@receiver((post_save, pre_delete), sender=Ingredient)
+def invalidate_ingredient_recipes(sender, instance, **kwargs):
+    touch_recipes(
+        RecipeIngredients.objects.filter(ingredient=instance).values_list(
+            "recipe_id", flat=True
+        )
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def invalidate_saved_recipe(sender, instance, created, **kwargs):
+    touch_recipes([instance.pk], list_changed=created)
+
+
+@receiver(post_delete, sender=Recipe)
+def invalidate_deleted_recipe(sender, instance, **kwargs):
+    touch_recipes([instance.pk], list_changed=True)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    if action.startswith("post_"):
+        touch_recipes(pk_set if reverse else [instance.pk], list_changed=True)
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def invalidate_recipe_counters(sender, instance, **kwargs):
+    if batch_in_progress.get():
+        return
+    touch_recipes([instance.recipe_id])
+
+
+@receiver(recipes_changed)
+def invalidate_changed_recipes(sender, recipe_ids, **kwargs):
+    touch_recipes(recipe_ids)
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_author_recipes(sender, instance, created,
+                              update_fields=None, **kwargs):
+    if created or (update_fields and set(update_fields) <= USER_HIDDEN_FIELDS):
+        return
+    touch_recipes(
+        Recipe.objects.filter(author=instance).values_list("pk", flat=True)
+    )
+
+
+# Смена пароля (SetPasswordSerializer.create), деактивация и любое
+# другое сохранение пользователя сбрасывают его токены в кэше.
+@receiver((post_save, post_delete), sender=CustomUser)
+def invalidate_user_auth(sender, instance, **kwargs):
+    invalidate_user_tokens(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    token_cache.discard(instance.key)
+    invalidate_user_tokens(instance.user_id)
@@ -0,0 +1,727 @@
+import base64
+import csv
+import io
+import json
+import shutil
+import tempfile
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connection
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITestCase
+
+from api.authentication import token_cache
+from api.checks import check_replicas_cache
+from foodgram.db_router import ReadReplicaRouter, replica_reads, use_primary
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredients,
+    ShoppingCart,
+    Tag,
+)
+from users.models import CustomUser
+
+PASSWORD = "Secret-password-42"
+
+
+@override_settings(SHARED_CACHE=True)
+class RecipeResponseCacheTests(APITestCase):
+    """Кэш ответов рецептов: общая анонимная запись, флаги пользователя
+    поверх неё, сброс по изменениям и по выходу из аккаунта."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = CustomUser.objects.create_user(
+            username="author", email="author@example.com",
+            password=PASSWORD, first_name="Автор", last_name="Авторов",
+        )
+        cls.user = CustomUser.objects.create_user(
+            username="reader", email="reader@example.com",
+            password=PASSWORD, first_name="Читатель", last_name="Читаев",
+        )
+        cls.tag = Tag.objects.create(
+            name="Завтрак", color="#E26C2D", slug="breakfast"
+        )
+        ingredient = Ingredient.objects.create(
+            name="молоко", measurement_unit="мл"
+        )
+        cls.recipes = []
+        for number in range(3):
+            recipe = Recipe.objects.create(
+                author=cls.author,
+                name=f"Рецепт {number}",
+                text="Описание",
+                image="recipes/test.png",
+                cooking_time=10,
+            )
+            recipe.tags.set([cls.tag])
+            RecipeIngredients.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=100
+            )
+            cls.recipes.append(recipe)
+
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        self.anonymous = APIClient()
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def write(self, method, url, data=None):
+        """Запись с выполнением on_commit: версии меняются после коммита."""
+        with self.captureOnCommitCallbacks(execute=True):
+            response = getattr(self.client, method)(url, data, format="json")
+        self.assertLess(response.status_code, 300, response.content)
+        return response
+
+    def recipes_by_id(self, client, url="/api/recipes/"):
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return {recipe["id"]: recipe for recipe in response.json()["results"]}
+
+    def test_user_flags_are_overlaid_on_anonymous_entry(self):
+        recipe = self.recipes[0]
+        self.write("post", f"/api/recipes/{recipe.pk}/favorite/")
+        self.write("post", f"/api/users/{self.author.pk}/subscribe/")
+
+        anonymous = self.recipes_by_id(self.anonymous)
+        # Запись в кэше; без сигналов её содержимое не меняется.
+        Recipe.objects.filter(pk=recipe.pk).update(name="Не из кэша")
+        authenticated = self.recipes_by_id(self.client)
+
+        self.assertEqual(authenticated[recipe.pk]["name"], recipe.name)
+        self.assertFalse(anonymous[recipe.pk]["is_favorited"])
+        self.assertFalse(anonymous[recipe.pk]["author"]["is_subscribed"])
+        self.assertTrue(authenticated[recipe.pk]["is_favorited"])
+        self.assertTrue(authenticated[recipe.pk]["author"]["is_subscribed"])
+        self.assertFalse(authenticated[self.recipes[1].pk]["is_favorited"])
+        self.assertFalse(
+            self.recipes_by_id(self.anonymous)[recipe.pk]["is_favorited"]
+        )
+
+    def test_detail_overlay(self):
+        recipe = self.recipes[1]
+        url = f"/api/recipes/{recipe.pk}/"
+        self.assertFalse(self.client.get(url).json()["is_in_shopping_cart"])
+        self.write("post", f"/api/recipes/{recipe.pk}/shopping_cart/")
+
+        self.assertTrue(self.client.get(url).json()["is_in_shopping_cart"])
+        self.assertFalse(
+            self.anonymous.get(url).json()["is_in_shopping_cart"]
+        )
+
+    def test_favorite_invalidates_counter(self):
+        recipe = self.recipes[0]
+        url = f"/api/recipes/{recipe.pk}/"
+        self.assertEqual(self.anonymous.get(url).json()["favorites_count"], 0)
+        self.write("post", f"/api/recipes/{recipe.pk}/favorite/")
+
+        self.assertEqual(self.anonymous.get(url).json()["favorites_count"], 1)
+        self.assertEqual(
+            self.recipes_by_id(self.anonymous)[recipe.pk]["favorites_count"],
+            1,
+        )
+
+    def test_tag_edit_invalidates_list(self):
+        self.recipes_by_id(self.anonymous)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.name = "Обед"
+            self.tag.save()
+
+        for recipe in self.recipes_by_id(self.anonymous).values():
+            self.assertEqual(recipe["tags"][0]["name"], "Обед")
+
+    def test_author_edit_invalidates_detail(self):
+        url = f"/api/recipes/{self.recipes[2].pk}/"
+        self.anonymous.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.first_name = "Переименован"
+            self.author.save()
+
+        self.assertEqual(
+            self.anonymous.get(url).json()["author"]["first_name"],
+            "Переименован",
+        )
+
+    def test_batch_add_and_remove_flags(self):
+        first, second, third = (recipe.pk for recipe in self.recipes)
+        self.recipes_by_id(self.client)
+        self.write(
+            "post", "/api/recipes/favorite/batch/",
+            {"recipes": [first, second]},
+        )
+        recipes = self.recipes_by_id(self.client)
+        self.assertTrue(recipes[first]["is_favorited"])
+        self.assertTrue(recipes[second]["is_favorited"])
+        self.assertFalse(recipes[third]["is_favorited"])
+
+        self.write(
+            "delete", "/api/recipes/favorite/batch/", {"recipes": [first]}
+        )
+        recipes = self.recipes_by_id(self.client)
+        self.assertFalse(recipes[first]["is_favorited"])
+        self.assertTrue(recipes[second]["is_favorited"])
+        self.assertEqual(recipes[second]["favorites_count"], 1)
+        self.assertEqual(
+            set(Favorite.objects.filter(user=self.user).values_list(
+                "recipe_id", flat=True
+            )),
+            {second},
+        )
+
+    def test_logout_revokes_cached_token(self):
+        client = APIClient()
+        response = client.post(
+            "/api/auth/token/login/",
+            {"email": self.user.email, "password": PASSWORD},
+        )
+        client.credentials(
+            HTTP_AUTHORIZATION=f"Token {response.json()['auth_token']}"
+        )
+        self.assertEqual(client.get("/api/users/me/").status_code, 200)
+        self.assertEqual(client.get("/api/recipes/").status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post("/api/auth/token/logout/")
+        self.assertEqual(response.status_code, 204)
+
+        self.assertEqual(client.get("/api/users/me/").status_code, 401)
+        self.assertEqual(client.get("/api/recipes/").status_code, 401)
+
+    def test_password_change_revokes_cached_token(self):
+        self.assertEqual(self.client.get("/api/users/me/").status_code, 200)
+        self.write(
+            "post", "/api/users/set_password/",
+            {"current_password": PASSWORD, "new_password": "N3w-password!"},
+        )
+
+        self.assertEqual(self.client.get("/api/users/me/").status_code, 401)
+        self.assertEqual(self.client.get("/api/recipes/").status_code, 401)
+        response = APIClient().post(
+            "/api/auth/token/login/",
+            {"email": self.user.email, "password": "N3w-password!"},
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_deactivation_revokes_cached_token(self):
+        self.assertEqual(self.client.get("/api/users/me/").status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+
+        self.assertEqual(self.client.get("/api/users/me/").status_code, 401)
+        self.assertEqual(self.client.get("/api/recipes/").status_code, 401)
+
+
+@override_settings(SHARED_CACHE=False)
+class LocalTokenCacheTests(APITestCase):
+    """Кэш токенов без общего кэша: работает в процессе, выход виден."""
+
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        self.user = CustomUser.objects.create_user(
+            username="local", email="local@example.com", password=PASSWORD,
+            first_name="Локальный", last_name="Пользователь",
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def test_token_is_cached_and_revoked_in_process(self):
+        self.assertEqual(self.client.get("/api/users/me/").status_code, 200)
+        self.assertIsNotNone(token_cache.get(self.token.key))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/api/auth/token/logout/")
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.client.get("/api/users/me/").status_code, 401)
+
+    def test_cached_token_user_is_not_shared(self):
+        self.client.get("/api/users/me/")
+        first, _ = token_cache.get(self.token.key)
+        first.user.first_name = "Изменён в запросе"
+        second, _ = token_cache.get(self.token.key)
+
+        self.assertIsNot(first.user, second.user)
+        self.assertEqual(second.user.first_name, "Локальный")
+
+
+@override_settings(SHARED_CACHE=False)
+class LocalReferenceCacheTests(APITestCase):
+    """Справочники без общего кэша: запись в процессе, 304 и сброс."""
+
+    def setUp(self):
+        cache.clear()
+        Tag.objects.create(name="Завтрак", color="#E26C2D", slug="breakfast")
+
+    def test_not_modified_and_invalidation(self):
+        response = self.client.get("/api/tags/")
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        last_modified = response["Last-Modified"]
+
+        self.assertEqual(
+            self.client.get(
+                "/api/tags/", HTTP_IF_NONE_MATCH=etag
+            ).status_code,
+            304,
+        )
+        self.assertEqual(
+            self.client.get(
+                "/api/tags/", HTTP_IF_MODIFIED_SINCE=last_modified
+            ).status_code,
+            304,
+        )
+
+        Tag.objects.create(name="Обед", color="#49B64E", slug="lunch")
+        response = self.client.get("/api/tags/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+
+
+@override_settings(SHARED_CACHE=False)
+class LocalRecipeResponseTests(APITestCase):
+    """Без общего кэша ответы рецептов не кэшируются."""
+
+    def setUp(self):
+        cache.clear()
+        author = CustomUser.objects.create_user(
+            username="local", email="local@example.com", password=PASSWORD,
+            first_name="Локальный", last_name="Автор",
+        )
+        self.recipe = Recipe.objects.create(
+            author=author, name="Рецепт", text="Описание",
+            image="recipes/test.png", cooking_time=10,
+        )
+
+    def test_changes_are_visible_without_signals(self):
+        url = f"/api/recipes/{self.recipe.pk}/"
+        self.assertEqual(self.client.get(url).json()["name"], "Рецепт")
+        self.client.get("/api/recipes/")
+        Recipe.objects.filter(pk=self.recipe.pk).update(name="Новое")
+
+        self.assertEqual(self.client.get(url).json()["name"], "Новое")
+        self.assertEqual(
+            self.client.get("/api/recipes/").json()["results"][0]["name"],
+            "Новое",
+        )
+
+    def test_flags_are_read_from_database(self):
+        user = CustomUser.objects.create_user(
+            username="reader", email="reader@example.com",
+            password=PASSWORD, first_name="Читатель", last_name="Читаев",
+        )
+        token = Token.objects.create(user=user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+        url = f"/api/recipes/{self.recipe.pk}/"
+        self.assertFalse(self.client.get(url).json()["is_favorited"])
+        # bulk_create не шлёт сигналов, которые сменили бы версию.
+        Favorite.objects.bulk_create(
+            [Favorite(user=user, recipe=self.recipe)]
+        )
+
+        self.assertTrue(self.client.get(url).json()["is_favorited"])
+
+
+class ReplicaCacheCheckTests(SimpleTestCase):
+    def test_replicas_without_shared_cache_warn(self):
+        with override_settings(
+            DATABASE_REPLICAS=["replica_1"], SHARED_CACHE=False
+        ):
+            self.assertEqual(
+                [error.id for error in check_replicas_cache(None)],
+                ["api.W001"],
+            )
+        with override_settings(
+            DATABASE_REPLICAS=["replica_1"], SHARED_CACHE=True
+        ):
+            self.assertEqual(check_replicas_cache(None), [])
+
+
+@override_settings(DATABASE_REPLICAS=["replica_1"], SHARED_CACHE=True)
+class ReadReplicaRoutingTests(APITestCase):
+    """Маршрутизация чтения: реплика replica_1 — зеркало основной базы,
+    как TEST.MIRROR у реплик из settings, поэтому запросы к ней идут в
+    default, а тест проверяет, какой алиас выбрал маршрутизатор."""
+
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        author = CustomUser.objects.create_user(
+            username="author", email="author@example.com",
+            password=PASSWORD, first_name="Автор", last_name="Авторов",
+        )
+        self.recipe = Recipe.objects.create(
+            author=author, name="Рецепт", text="Описание",
+            image="recipes/test.png", cooking_time=10,
+        )
+        user = CustomUser.objects.create_user(
+            username="reader", email="reader@example.com",
+            password=PASSWORD, first_name="Читатель", last_name="Читаев",
+        )
+        token = Token.objects.create(user=user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+        self.routed = []
+        route = ReadReplicaRouter.db_for_read
+
+        def record(router, model, **hints):
+            alias = route(router, model, **hints)
+            self.routed.append(alias)
+            return alias and DEFAULT_DB_ALIAS
+
+        patcher = mock.patch.object(ReadReplicaRouter, "db_for_read", record)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def read_aliases(self):
+        self.routed.clear()
+        self.assertEqual(self.client.get("/api/users/").status_code, 200)
+        return set(self.routed)
+
+    def favorite(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                f"/api/recipes/{self.recipe.pk}/favorite/"
+            )
+        self.assertEqual(response.status_code, 201)
+
+    def test_write_pins_reads_to_primary(self):
+        self.assertIn("replica_1", self.read_aliases())
+        self.favorite()
+
+        self.assertEqual(self.read_aliases(), {None})
+
+    def test_pin_expires_after_window(self):
+        with override_settings(READ_YOUR_WRITES_WINDOW=0):
+            self.favorite()
+
+        self.assertIn("replica_1", self.read_aliases())
+
+    def test_use_primary_overrides_replica_reads(self):
+        router = ReadReplicaRouter()
+        token = replica_reads.set(True)
+        self.addCleanup(replica_reads.reset, token)
+        self.assertEqual(router.db_for_read(Recipe), DEFAULT_DB_ALIAS)
+        with use_primary():
+            self.assertIsNone(router.db_for_read(Recipe))
+        self.assertEqual(self.routed, ["replica_1", None])
+
+
+class KeysetPaginationTests(APITestCase):
+    """Курсорная пагинация списка рецептов по ключу (pub_date, id)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = CustomUser.objects.create_user(
+            username="author", email="author@example.com",
+            password=PASSWORD, first_name="Автор", last_name="Авторов",
+        )
+        for number in range(5):
+            Recipe.objects.create(
+                author=author, name=f"Рецепт {number}", text="Описание",
+                image="recipes/test.png", cooking_time=10,
+            )
+        # Одинаковая дата у всех, как после миграции 0012.
+        Recipe.objects.update(pub_date=timezone.now())
+        cls.ids = list(
+            Recipe.objects.order_by("-pub_date", "-id")
+            .values_list("id", flat=True)
+        )
+
+    def page(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        return [recipe["id"] for recipe in data["results"]], data
+
+    def test_pages_cover_ties_without_gaps(self):
+        ids, data = self.page("/api/recipes/?pagination=cursor&limit=2")
+        self.assertIsNone(data["previous"])
+        while data["next"]:
+            page, data = self.page(data["next"])
+            ids.extend(page)
+
+        self.assertEqual(ids, self.ids)
+
+    def test_previous_link_walks_back(self):
+        _, first = self.page("/api/recipes/?pagination=cursor&limit=2")
+        second_ids, second = self.page(first["next"])
+        _, third = self.page(second["next"])
+
+        self.assertEqual(self.page(third["previous"])[0], second_ids)
+        self.assertEqual(self.page(second["previous"])[0], self.ids[:2])
+
+    def test_cursor_encodes_full_key(self):
+        _, data = self.page("/api/recipes/?pagination=cursor&limit=2")
+        cursor = parse_qs(urlparse(data["next"]).query)["cursor"][0]
+        decoded = json.loads(base64.urlsafe_b64decode(cursor))
+        recipe = Recipe.objects.get(pk=self.ids[1])
+
+        self.assertEqual(
+            decoded,
+            {"p": [recipe.pub_date.isoformat(), recipe.pk], "r": False},
+        )
+
+    def test_malformed_cursor_is_not_found(self):
+        short = base64.urlsafe_b64encode(
+            json.dumps({"p": [1], "r": False}).encode()
+        ).decode()
+        for cursor in ("not-a-cursor", short):
+            response = self.client.get(f"/api/recipes/?cursor={cursor}")
+            self.assertEqual(response.status_code, 404)
+
+
+def png_base64():
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8), "red").save(buffer, "PNG")
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f"data:image/png;base64,{encoded}"
+
+
+class RecipeIngredientsUpdateTests(APITestCase):
+    """Обновление рецепта пишет только разницу в ингредиентах."""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.author = CustomUser.objects.create_user(
+            username="author", email="author@example.com",
+            password=PASSWORD, first_name="Автор", last_name="Авторов",
+        )
+        self.client.force_authenticate(self.author)
+        self.tag = Tag.objects.create(
+            name="Завтрак", color="#E26C2D", slug="breakfast"
+        )
+        self.milk, self.flour, self.salt = (
+            Ingredient.objects.create(name=name, measurement_unit="г")
+            for name in ("молоко", "мука", "соль")
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.author, name="Блины", text="Описание",
+            image="recipes/test.png", cooking_time=10,
+        )
+        self.recipe.tags.set([self.tag])
+        RecipeIngredients.objects.bulk_create([
+            RecipeIngredients(
+                recipe=self.recipe, ingredient=self.milk, amount=100
+            ),
+            RecipeIngredients(
+                recipe=self.recipe, ingredient=self.flour, amount=50
+            ),
+        ])
+
+    def update(self, ingredients):
+        response = self.client.patch(
+            f"/api/recipes/{self.recipe.pk}/",
+            {
+                "name": "Блины",
+                "text": "Описание",
+                "cooking_time": 10,
+                "image": png_base64(),
+                "tags": [self.tag.pk],
+                "ingredients": [
+                    {"id": ingredient.pk, "amount": amount}
+                    for ingredient, amount in ingredients
+                ],
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def rows(self):
+        return {
+            row.ingredient_id: (row.pk, row.amount)
+            for row in RecipeIngredients.objects.filter(recipe=self.recipe)
+        }
+
+    def test_changes_added_and_removed_rows(self):
+        milk_row = self.rows()[self.milk.pk][0]
+        response = self.update([(self.milk, 70), (self.salt, 5)])
+
+        self.assertEqual(
+            self.rows(),
+            {self.milk.pk: (milk_row, 70), self.salt.pk: (mock.ANY, 5)},
+        )
+        self.assertEqual(
+            {
+                item["id"]: item["amount"]
+                for item in response.json()["ingredients"]
+            },
+            {self.milk.pk: 70, self.salt.pk: 5},
+        )
+
+    def test_unchanged_ingredients_are_not_written(self):
+        before = self.rows()
+        with CaptureQueriesContext(connection) as queries:
+            self.update([(self.milk, 100), (self.flour, 50)])
+
+        self.assertEqual(self.rows(), before)
+        table = RecipeIngredients._meta.db_table
+        self.assertFalse([
+            query["sql"] for query in queries
+            if table in query["sql"]
+            and not query["sql"].startswith("SELECT")
+        ])
+
+
+class RecipeBatchTests(APITestCase):
+    """Пакетное добавление и удаление: статус по каждому рецепту и
+    счётчики, изменённые один раз на рецепт."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = CustomUser.objects.create_user(
+            username="author", email="author@example.com",
+            password=PASSWORD, first_name="Автор", last_name="Авторов",
+        )
+        cls.user = CustomUser.objects.create_user(
+            username="reader", email="reader@example.com",
+            password=PASSWORD, first_name="Читатель", last_name="Читаев",
+        )
+        cls.first, cls.second = (
+            Recipe.objects.create(
+                author=author, name=f"Рецепт {number}", text="Описание",
+                image="recipes/test.png", cooking_time=10,
+            ).pk
+            for number in range(2)
+        )
+        cls.missing = cls.second + 1000
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def batch(self, method, url, recipes):
+        response = getattr(self.client, method)(
+            url, {"recipes": recipes}, format="json"
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        return {
+            item["id"]: item["status"] for item in response.json()["results"]
+        }
+
+    def counts(self, field):
+        return dict(Recipe.objects.values_list("pk", field))
+
+    def test_favorite_statuses_and_counters(self):
+        url = "/api/recipes/favorite/batch/"
+        self.batch("post", url, [self.first])
+        statuses = self.batch(
+            "post", url, [self.first, self.second, self.missing, self.second]
+        )
+
+        self.assertEqual(statuses, {
+            self.first: "already_added",
+            self.second: "added",
+            self.missing: "not_found",
+        })
+        self.assertEqual(
+            self.counts("favorites_count"),
+            {self.first: 1, self.second: 1},
+        )
+
+        statuses = self.batch(
+            "delete", url, [self.first, self.first, self.missing]
+        )
+        self.assertEqual(
+            statuses, {self.first: "removed", self.missing: "not_found"}
+        )
+        statuses = self.batch("delete", url, [self.first, self.second])
+        self.assertEqual(
+            statuses, {self.first: "not_in_list", self.second: "removed"}
+        )
+        self.assertEqual(
+            self.counts("favorites_count"),
+            {self.first: 0, self.second: 0},
+        )
+        self.assertFalse(Favorite.objects.filter(user=self.user).exists())
+
+    def test_shopping_cart_counters(self):
+        url = "/api/recipes/shopping_cart/batch/"
+        self.batch("post", url, [self.first, self.second])
+        self.batch("delete", url, [self.second])
+
+        self.assertEqual(
+            self.counts("in_carts_count"),
+            {self.first: 1, self.second: 0},
+        )
+
+    def test_invalid_batch_is_rejected(self):
+        for recipes in ([], ["abc"], [0]):
+            response = self.client.post(
+                "/api/recipes/favorite/batch/",
+                {"recipes": recipes},
+                format="json",
+            )
+            self.assertEqual(response.status_code, 400)
+
+
+class ShoppingListExportTests(APITestCase):
+    """Выгрузка списка покупок: суммирование в базе и разбивка по
+    рецептам, в том числе одноимённым."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(
+            username="reader", email="reader@example.com",
+            password=PASSWORD, first_name="Читатель", last_name="Читаев",
+        )
+        milk = Ingredient.objects.create(name="молоко", measurement_unit="мл")
+        salt = Ingredient.objects.create(name="соль", measurement_unit="г")
+        for amount in (100, 250):
+            recipe = Recipe.objects.create(
+                author=cls.user, name="Блины", text="Описание",
+                image="recipes/test.png", cooking_time=10,
+            )
+            RecipeIngredients.objects.create(
+                recipe=recipe, ingredient=milk, amount=amount
+            )
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        RecipeIngredients.objects.create(
+            recipe=recipe, ingredient=salt, amount=5
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def export(self, query):
+        response = self.client.get(
+            f"/api/recipes/download_shopping_cart/?{query}"
+        )
+        self.assertEqual(response.status_code, 200)
+        content = b"".join(response.streaming_content).decode()
+        return list(csv.reader(io.StringIO(content)))
+
+    def test_amounts_are_summed(self):
+        for query in ("type=csv", "type=csv&by_recipe=0"):
+            self.assertEqual(self.export(query), [
+                ["Ingredient_name", "measurement_unit", "Amount"],
+                ["молоко", "мл", "350"],
+                ["соль", "г", "5"],
+            ])
+
+    def test_same_name_recipes_are_not_merged(self):
+        self.assertEqual(self.export("type=csv&by_recipe=true"), [
+            ["Recipe", "Ingredient_name", "measurement_unit", "Amount"],
+            ["Блины", "молоко", "мл", "100"],
+            ["Блины", "молоко", "мл", "250"],
+            ["Блины", "соль", "г", "5"],
+        ])
+
+    def test_invalid_parameters(self):
+        for query in ("type=doc", "by_recipe=maybe"):
+            response = self.client.get(
+                f"/api/recipes/download_shopping_cart/?{query}"
+            )
+            self.assertEqual(response.status_code, 400)
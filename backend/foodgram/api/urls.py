@@ -1,7 +1,19 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import IngredientsViewSet, RecipeViewSet, TagsViewSet, UserViewSet
+from .async_views import (
+    ingredient_list_view,
+    recipe_detail_view,
+    recipe_list_view,
+    tag_list_view,
+)
+from .views import (
+    IngredientsViewSet,
+    MetricsView,
+    RecipeViewSet,
+    TagsViewSet,
+    UserViewSet,
+)
 
 app_name = "api"
 
@@ -13,5 +25,11 @@ router.register("tags", TagsViewSet, basename="tags")
 router.register("recipes", RecipeViewSet, basename="recipes")
 
 urlpatterns = [
+    path("metrics/", MetricsView.as_view(), name="metrics"),
+    # Горячие GET-запросы обслуживаются асинхронно (см. api.async_views).
+    path("recipes/", recipe_list_view),
+    path("recipes/<int:pk>/", recipe_detail_view),
+    path("tags/", tag_list_view),
+    path("ingredients/", ingredient_list_view),
     path("", include(router.urls)),
 ]
@@ -1,23 +1,39 @@
-import csv
-
 from django.contrib.auth import get_user_model
-from django.http import HttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.db import IntegrityError, transaction
+from django.db.models import F, Prefetch, Window
+from django.db.models.functions import RowNumber
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
-from rest_framework import permissions, status, viewsets
+from rest_framework import (
+    permissions,
+    renderers,
+    serializers,
+    status,
+    viewsets,
+)
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from api.filters import IngredientSearchFilter, RecipeFilter
+from api.cache import CachedRecipeResponseMixin, CachedReferenceListMixin
+from api.filters import RecipeFilter
+from api.metrics import request_metrics
+from api.pagination import KeysetPagination
 from api.permissions import IsAuthorAdminOrReadOnly
 from api.serializers import (
     CreateRecipeSerializer,
     FavoriteSerializer,
     IngredientSerializer,
+    MatchedRecipeSerializer,
     ProfileCreateSerializer,
     ProfileReadSerializer,
     ReadRecipeSerializer,
+    RecipeBatchSerializer,
     SetPasswordSerializer,
     ShoppingCartSerializer,
     SubscribeResponseSerializer,
@@ -29,37 +45,54 @@ from recipes.models import (
     Favorite,
     Ingredient,
     Recipe,
-    RecipeIngredients,
     ShoppingCart,
     Tag,
 )
+from recipes.autocomplete import ingredient_index
+from recipes.feed import get_feed
+from recipes.matching import recipe_match_index
+from recipes.shopping_list import (
+    EXPORT_FORMATS,
+    aiter_export,
+    export_shopping_list,
+)
+from recipes.user_lists import add_recipes, remove_recipes
 from users.models import Follow
 
 User = get_user_model()
 
 
-class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientsViewSet(CachedReferenceListMixin,
+                         viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = (DjangoFilterBackend,)
-    filterset_class = IngredientSearchFilter
-    search_fields = ("^name",)
     pagination_class = None
+    reference_name = "ingredients"
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get("name")
+        if name:
+            return Response(ingredient_index.search(name))
+        return super().list(request, *args, **kwargs)
 
 
-class TagsViewSet(viewsets.ReadOnlyModelViewSet):
+class TagsViewSet(CachedReferenceListMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
+    reference_name = "tags"
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(CachedRecipeResponseMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     permission_classes = (IsAuthorAdminOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_fields = ("author", "tags")
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        return Recipe.objects.with_related()
+
     def get_serializer_class(self):
         if self.request.method in permissions.SAFE_METHODS:
             return ReadRecipeSerializer
@@ -67,35 +100,34 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     def __post_delete_func(self, request, pk,
                            serializer_param, model, message):
+        recipe = get_object_or_404(Recipe, id=pk)
         if request.method == "POST":
-            context = {"request": request}
-            recipe = get_object_or_404(Recipe, id=pk)
-            data = {"user": request.user.id, "recipe": recipe.id}
-            serializer = serializer_param(data=data, context=context)
-            try:
-                serializer.is_valid(raise_exception=True)
-                serializer.save()
-                return Response(serializer.data,
-                                status=status.HTTP_201_CREATED)
-            except Exception:
-                return Response(serializer.error,
-                                status=status.HTTP_400_BAD_REQUEST)
-        if request.method == "DELETE":
-            recipe = get_object_or_404(Recipe, pk=pk)
             try:
-                obj = get_object_or_404(model,
-                                        user=request.user.id,
-                                        recipe=recipe)
-                obj.delete()
+                with transaction.atomic():
+                    obj = model.objects.create(
+                        user=request.user, recipe=recipe
+                    )
+            except IntegrityError:
                 return Response(
-                    {"message": {message}},
-                    status=status.HTTP_204_NO_CONTENT
-                )
-            except Exception:
-                return Response(
-                    {"errors": "Объект не найден"},
+                    {"errors": "Рецепт уже добавлен"},
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            serializer = serializer_param(
+                obj, context={"request": request}
+            )
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        deleted = model.objects.filter(
+            user=request.user, recipe=recipe
+        ).delete()[0]
+        if not deleted:
+            return Response(
+                {"errors": "Объект не найден"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(
+            {"message": message},
+            status=status.HTTP_204_NO_CONTENT
+        )
 
     @action(
         detail=True,
@@ -121,31 +153,126 @@ class RecipeViewSet(viewsets.ModelViewSet):
             request, pk, ShoppingCartSerializer, ShoppingCart, message
         )
 
+    def __batch_func(self, request, model):
+        serializer = RecipeBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data["recipes"]
+        if request.method == "POST":
+            results = add_recipes(model, request.user, recipe_ids)
+        else:
+            results = remove_recipes(model, request.user, recipe_ids)
+        return Response(
+            {"results": [
+                {"id": recipe_id, "status": result}
+                for recipe_id, result in results.items()
+            ]}
+        )
+
+    @action(
+        detail=False,
+        permission_classes=(permissions.IsAuthenticated,),
+        url_path="favorite/batch",
+        url_name="favorite_batch",
+        methods=["POST", "DELETE"],
+    )
+    def favorite_batch(self, request):
+        return self.__batch_func(request, Favorite)
+
+    @action(
+        detail=False,
+        permission_classes=(permissions.IsAuthenticated,),
+        url_path="shopping_cart/batch",
+        url_name="shopping_cart_batch",
+        methods=["POST", "DELETE"],
+    )
+    def shopping_cart_batch(self, request):
+        return self.__batch_func(request, ShoppingCart)
+
+    @action(
+        methods=["GET"],
+        detail=False,
+        permission_classes=(permissions.IsAuthenticated,),
+    )
+    def feed(self, request):
+        """Рецепты авторов, на которых подписан пользователь."""
+        queryset = get_feed(request.user).with_related()
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = ReadRecipeSerializer(
+            page, many=True, context={"request": request}
+        )
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(
+        methods=["GET"],
+        detail=False,
+        url_path="what_can_i_cook",
+        url_name="what_can_i_cook",
+    )
+    def what_can_i_cook(self, request):
+        """Рецепты, отсортированные по тому, сколько ингредиентов из
+        ?ingredients=1,2,3 у пользователя уже есть."""
+        ingredient_ids = [
+            int(value)
+            for param in request.query_params.getlist("ingredients")
+            for value in param.split(",")
+            if value.strip().isdigit()
+        ]
+        if not ingredient_ids:
+            return Response(
+                {"errors": "Укажите ингредиенты"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        paginator = LimitOffsetPagination()
+        page = paginator.paginate_queryset(
+            recipe_match_index.match(ingredient_ids), request, view=self
+        )
+        recipes = Recipe.objects.in_bulk(
+            [recipe_id for recipe_id, _, _ in page]
+        )
+        results = []
+        for recipe_id, matched_count, missing_count in page:
+            recipe = recipes.get(recipe_id)
+            if recipe is not None:
+                recipe.matched_count = matched_count
+                recipe.missing_count = missing_count
+                results.append(recipe)
+        serializer = MatchedRecipeSerializer(
+            results, many=True, context={"request": request}
+        )
+        return paginator.get_paginated_response(serializer.data)
+
     @action(
         methods=["GET"],
         detail=False,
         permission_classes=(permissions.IsAuthenticated,)
     )
     def download_shopping_cart(self, request):
-        objects = RecipeIngredients.objects.filter(
-            recipe__shopping_cart_recipe__user=request.user
+        file_format = request.query_params.get("type", "csv")
+        if file_format not in EXPORT_FORMATS:
+            return Response(
+                {"errors": "Неподдерживаемый формат файла"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        # "0" и "false" — тоже непустые строки, поэтому разбираем явно.
+        try:
+            by_recipe = serializers.BooleanField().to_internal_value(
+                request.query_params.get("by_recipe") or False
+            )
+        except ValidationError:
+            return Response(
+                {"errors": "by_recipe должен быть true или false"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        content_type, content = export_shopping_list(
+            request.user, file_format, by_recipe=by_recipe
         )
-        response = HttpResponse(content_type="text/csv")
-        response["Content-Disposition"] = "attachment; " \
-                                          "" "filename=shopping_cart.csv"
-        writer = csv.writer(response)
-        writer.writerow(["Recipe",
-                         "Ingredient_name",
-                         "Amount",
-                         "measurement_unit"])
-        object_fields = objects.values_list(
-            "recipe__name",
-            "ingredient__name",
-            "amount",
-            "ingredient__measurement_unit"
+        if isinstance(request._request, ASGIRequest):
+            content = aiter_export(content)
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response["Content-Disposition"] = (
+            f"attachment; filename=shopping_cart.{file_format}"
         )
-        for object in object_fields:
-            writer.writerow(object)
         return response
 
 
@@ -174,12 +301,20 @@ class UserViewSet(UserViewSet):
     def subscribe(self, request, id):
         if request.method == "POST":
             context = {"request": request}
-            author = get_object_or_404(User, id=id)
+            author = get_object_or_404(
+                User.objects.prefetch_related(
+                    Prefetch("recipes",
+                             queryset=Recipe.objects.with_related())
+                ),
+                id=id,
+            )
             data = {"user": request.user.id, "author": author.id}
             serializer = SubscribeSerializer(data=data, context=context)
             serializer.is_valid(raise_exception=True)
             serializer.save()
-            author_serializer = SubscribeResponseSerializer(author)
+            author_serializer = SubscribeResponseSerializer(
+                author, context=context
+            )
             return Response(author_serializer.data,
                             status=status.HTTP_201_CREATED)
         if request.method == "DELETE":
@@ -197,14 +332,39 @@ class UserViewSet(UserViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
+    @staticmethod
+    def get_subscriptions_queryset(user, recipes_limit=None):
+        """Авторы, на которых подписан user, с рецептами в одном Prefetch.
+        recipes_limit применяется оконной функцией ROW_NUMBER() по автору,
+        а не отдельным запросом на каждого автора."""
+        recipes = Recipe.objects.all()
+        if recipes_limit and recipes_limit.isdigit():
+            recipes = recipes.annotate(
+                row_number=Window(
+                    RowNumber(),
+                    partition_by=F("author"),
+                    order_by=Recipe._meta.ordering,
+                )
+            ).filter(row_number__lte=int(recipes_limit))
+        return (
+            User.objects.filter(following__user=user)
+            .annotate(follow_id=F("following__id"))
+            .order_by("-follow_id")
+            .prefetch_related(
+                Prefetch("recipes", queryset=recipes,
+                         to_attr="limited_recipes")
+            )
+        )
+
     @action(
         detail=False,
         permission_classes=(permissions.IsAuthenticated,),
         methods=("get",),
     )
     def subscriptions(self, request):
-        user = self.request.user
-        queryset = Follow.objects.filter(user=user)
+        queryset = self.get_subscriptions_queryset(
+            request.user, request.query_params.get("recipes_limit")
+        )
         page = self.paginate_queryset(queryset)
         serializer = SubscriptionSerializer(
             page, many=True, context={"request": request}
@@ -242,3 +402,23 @@ class UserViewSet(UserViewSet):
             )
         return Response(serializer.errors,
                         status=status.HTTP_400_BAD_REQUEST)
+
+
+class PrometheusRenderer(renderers.BaseRenderer):
+    media_type = "text/plain"
+    format = "txt"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return str(data).encode(self.charset)
+
+
+class MetricsView(APIView):
+    permission_classes = (permissions.IsAdminUser,)
+    renderer_classes = (PrometheusRenderer,)
+
+    def get(self, request):
+        return Response(
+            request_metrics.render(),
+            content_type="text/plain; version=0.0.4; charset=utf-8",
+        )
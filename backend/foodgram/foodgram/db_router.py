@@ -0,0 +1,50 @@
+"""Чтение с реплик для запросов с безопасными методами.
+
+Маршрутизатор отправляет чтение на реплики только внутри запроса, для
+которого ReadReplicaMiddleware включила replica_reads; запись, команды
+управления и всё вне запроса работают с основной базой."""
+
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# Контекст копируется в потоки sync_to_async, как и счётчик запросов
+# в api.middleware, поэтому флаг виден и асинхронному ORM.
+replica_reads = ContextVar("replica_reads", default=False)
+
+
+@contextmanager
+def use_primary():
+    """Читает с основной базы: для всего, что попадает в общий кэш или
+    держится в памяти процесса, — отставшая реплика не должна
+    законсервироваться в нём."""
+    token = replica_reads.set(False)
+    try:
+        yield
+    finally:
+        replica_reads.reset(token)
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if settings.DATABASE_REPLICAS and replica_reads.get():
+            return random.choice(settings.DATABASE_REPLICAS)
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Без этого объект, прочитанный с реплики, сохранялся бы туда же.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
@@ -0,0 +1,141 @@
+"""PostgreSQL с пулом соединений внутри процесса.
+
+Вместо нового подключения соединение берётся из пула psycopg2 и при
+закрытии возвращается обратно, так что запрос не платит за TCP и
+аутентификацию. Включается этим ENGINE и ключом POOL в настройках базы:
+MIN_SIZE — сколько простаивающих соединений держать, MAX_SIZE — предел
+одновременно открытых, CHECK_IDLE — через сколько секунд простоя
+соединение проверяется запросом SELECT 1 перед выдачей."""
+
+import threading
+import time
+
+import psycopg2
+import psycopg2.extras
+from psycopg2 import pool
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.base import IsolationLevel
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool(pool.ThreadedConnectionPool):
+    def __init__(self, min_size, max_size, check_idle, **conn_params):
+        self.check_idle = check_idle
+        self.created = 0
+        self.checkouts = 0
+        self.discarded = 0
+        self.overflow = 0
+        self._returned_at = {}
+        super().__init__(min_size, max_size, **conn_params)
+
+    def _connect(self, key=None):
+        # Вызывается из getconn/putconn под self._lock.
+        self.created += 1
+        return super()._connect(key)
+
+    def checkout(self):
+        """Соединение из пула; None, если пул исчерпан.
+
+        Счётчики и время возврата меняются под self._lock, как и сам пул;
+        getconn/putconn берут его сами, поэтому вызываются вне него."""
+        while True:
+            try:
+                connection = self.getconn()
+            except pool.PoolError:
+                with self._lock:
+                    self.overflow += 1
+                return None
+            with self._lock:
+                returned_at = self._returned_at.pop(id(connection), None)
+            if not connection.closed and (
+                returned_at is None
+                or time.monotonic() - returned_at < self.check_idle
+                or is_alive(connection)
+            ):
+                with self._lock:
+                    self.checkouts += 1
+                return connection
+            with self._lock:
+                self.discarded += 1
+            self.putconn(connection, close=True)
+
+    def checkin(self, connection):
+        # Время возврата записывается до putconn: после него соединение
+        # сразу может достаться другому потоку.
+        with self._lock:
+            self._returned_at[id(connection)] = time.monotonic()
+        self.putconn(connection, close=bool(connection.closed))
+        # Сверх MIN_SIZE соединение закрывается, а не остаётся в пуле.
+        if connection.closed:
+            with self._lock:
+                self._returned_at.pop(id(connection), None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "idle": len(self._pool),
+                "in_use": len(self._used),
+                "max_size": self.maxconn,
+                "created": self.created,
+                "checkouts": self.checkouts,
+                "discarded": self.discarded,
+                "overflow": self.overflow,
+            }
+
+
+def is_alive(connection):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def get_pool(alias, settings_dict, conn_params):
+    with _pools_lock:
+        if alias not in _pools:
+            options = settings_dict.get("POOL", {})
+            _pools[alias] = ConnectionPool(
+                options.get("MIN_SIZE", 1),
+                options.get("MAX_SIZE", 10),
+                options.get("CHECK_IDLE", 30),
+                **conn_params,
+            )
+        return _pools[alias]
+
+
+def pool_stats():
+    with _pools_lock:
+        pools = list(_pools.items())
+    return {alias: connection_pool.stats() for alias, connection_pool in pools}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_new_connection(self, conn_params):
+        connection_pool = get_pool(self.alias, self.settings_dict, conn_params)
+        connection = connection_pool.checkout()
+        if connection is None:
+            # Пул исчерпан: отдельное соединение, которое закроется
+            # как обычно, а не вернётся в пул.
+            return super().get_new_connection(conn_params)
+        options = self.settings_dict["OPTIONS"]
+        self.isolation_level = IsolationLevel(
+            options.get("isolation_level", IsolationLevel.READ_COMMITTED)
+        )
+        if "isolation_level" in options:
+            connection.isolation_level = self.isolation_level
+        psycopg2.extras.register_default_jsonb(
+            conn_or_curs=connection, loads=lambda x: x
+        )
+        connection.pool = connection_pool
+        return connection
+
+    def _close(self):
+        connection_pool = getattr(self.connection, "pool", None)
+        if connection_pool is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            connection_pool.checkin(self.connection)
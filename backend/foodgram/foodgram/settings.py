@@ -52,6 +52,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.middleware.RequestMetricsMiddleware",
+    "api.middleware.ReadReplicaMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -98,10 +100,96 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', 'django'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
         'HOST': os.getenv('DB_HOST', ''),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'PORT': os.getenv('DB_PORT', 5432),
+        # Образ запускается под ASGI (UvicornWorker), где у каждого запроса
+        # свой поток, а соединения Django привязаны к потоку: постоянное
+        # соединение осталось бы открытым на каждый поток. Поэтому по
+        # умолчанию соединение закрывается в конце запроса; повторное
+        # использование даёт пул ниже. DB_CONN_MAX_AGE имеет смысл под
+        # WSGI с постоянным набором потоков.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 0)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Пул соединений внутри процесса (см. foodgram.pooled_postgresql),
+# включается явно, например DB_POOL_MAX_SIZE=20. Под ASGI запросы идут
+# из разных потоков, и постоянные соединения копились бы по потокам,
+# поэтому с пулом соединение возвращается в него в конце каждого
+# запроса. Размер пула умножается на число процессов сервера и должен
+# укладываться в max_connections базы.
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', 0))
+
+if DB_POOL_MAX_SIZE:
+    DATABASES['default'].update({
+        'ENGINE': 'foodgram.pooled_postgresql',
+        'CONN_MAX_AGE': 0,
+        'POOL': {
+            'MIN_SIZE': int(os.getenv('DB_POOL_MIN_SIZE', 5)),
+            'MAX_SIZE': DB_POOL_MAX_SIZE,
+            'CHECK_IDLE': int(os.getenv('DB_POOL_CHECK_IDLE', 30)),
+        },
+    })
+
+# Реплики только для чтения: DB_REPLICA_HOSTS=host1,host2:5433. Запросы
+# с безопасными методами читают с них (см. foodgram.db_router). Для
+# локальной проверки подойдёт любой алиас из DATABASES, перечисленный в
+# DATABASE_REPLICAS, например вторая база SQLite.
+DATABASE_REPLICAS = []
+
+for number, replica in enumerate(
+    filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), 1
+):
+    host, _, port = replica.strip().partition(':')
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{number}')
+
+DATABASE_ROUTERS = ['foodgram.db_router.ReadReplicaRouter']
+
+# Сколько секунд после записи клиент читает с основной базы.
+READ_YOUR_WRITES_WINDOW = int(os.getenv('READ_YOUR_WRITES_WINDOW', 5))
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+if os.getenv("REDIS_URL"):
+    CACHES["default"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("REDIS_URL"),
+    }
+
+# Виден ли кэш всем процессам. У LocMemCache свой кэш в каждом процессе,
+# и то, что должно быть согласовано между ними (отзыв токенов, версии
+# ответов, закрепление за основной базой), работает в упрощённом режиме:
+# см. места, где проверяется SHARED_CACHE. SHARED_CACHE=1 считает общим
+# и LocMemCache, если процесс один (runserver, тесты).
+SHARED_CACHE = (
+    "locmem" not in CACHES["default"]["BACKEND"]
+    or os.getenv("SHARED_CACHE", "").lower() in ("1", "true")
+)
+
+REFERENCE_CACHE_TIMEOUT = 60 * 60 * 24
+# Без общего кэша: предел устаревания справочника в других процессах.
+REFERENCE_LOCAL_CACHE_TIMEOUT = 60
+# Списки живут недолго: версии их рецептов читаются уже после выборки.
+RECIPE_LIST_CACHE_TIMEOUT = 60
+RECIPE_DETAIL_CACHE_TIMEOUT = 60 * 10
+# Множества избранного, покупок и подписок пользователя.
+MEMBERSHIP_CACHE_TIMEOUT = 60 * 60
+
+REQUEST_METRICS_ENABLED = True
+
+TOKEN_CACHE_MAX_SIZE = 10000
+TOKEN_CACHE_TTL = 300
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -150,9 +238,9 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.AllowAny",),
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework.authentication.TokenAuthentication",
+        "api.authentication.CachedTokenAuthentication",
     ),
-    "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.LimitOffsetPagination",
+    "DEFAULT_PAGINATION_CLASS": "api.pagination.LimitOffsetOrCursorPagination",
     "PAGE_SIZE": 6,
     "PAGINATE_BY_PARAM": "limit",
 }
@@ -173,3 +261,35 @@ DJOSER = {
 
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Картинка рецепта приходит в base64, тело запроса на треть больше файла.
+RECIPE_IMAGE_MAX_SIZE = 5 * 1024 * 1024
+DATA_UPLOAD_MAX_MEMORY_SIZE = 8 * 1024 * 1024
+RECIPE_IMAGE_ASYNC = True
+RECIPE_IMAGE_WORKERS = 2
+RECIPE_THUMBNAIL_SIZE = 480
+RECIPE_IMAGE_MAX_DIMENSION = 1600
+RECIPE_WEBP_QUALITY = 80
+# Файл, который записали или переиспользовали недавно, не удаляется как
+# осиротевший: ссылка на него может ждать коммита другой транзакции.
+RECIPE_IMAGE_ORPHAN_GRACE = 60 * 60
+
+RECIPE_SEARCH_CONFIG = "russian"
+RECIPE_SEARCH_FALLBACK_LIMIT = 1000
+
+MATCH_RESULTS_LIMIT = 1000
+MATCH_INDEX_REBUILD_INTERVAL = 30
+MATCH_INDEX_TTL = 300
+
+RECIPE_BATCH_MAX_SIZE = 200
+
+FEED_FANOUT_MAX_FOLLOWERS = 1000
+FEED_BACKFILL_SIZE = 100
+
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    "SHOPPING_LIST_PDF_FONT",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+)
+
+INGREDIENT_AUTOCOMPLETE_LIMIT = 20
+INGREDIENT_INDEX_TTL = 300
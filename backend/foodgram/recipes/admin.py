@@ -2,9 +2,15 @@ from django.contrib import admin
 
 from .models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
 
+
+@admin.register(Recipe)
+class RecipeAdmin(admin.ModelAdmin):
+    list_display = ("name", "author", "favorites_count", "in_carts_count")
+    readonly_fields = ("favorites_count", "in_carts_count")
+
+
 admin.site.register(Ingredient)
 admin.site.register(Tag)
-admin.site.register(Recipe)
 admin.site.register(Favorite)
 admin.site.register(ShoppingCart)
 # Register your models here.
@@ -0,0 +1,85 @@
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+from foodgram.db_router import use_primary
+
+from .models import Ingredient
+
+
+class IngredientIndex:
+    """Индекс ингредиентов для автодополнения в памяти процесса.
+
+    Названия хранятся в отсортированных массивах: по полному названию и
+    по каждому слову названия. Поиск по префиксу — бинарный поиск, поэтому
+    время ответа не зависит от размера каталога. Совпадения с начала
+    названия идут раньше совпадений с начала любого другого слова.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (названия, слова, время построения) меняется одним
+        # присваиванием: поиск работает со своим снимком целиком.
+        self._snapshot = None
+
+    def invalidate(self):
+        self._snapshot = None
+
+    @use_primary()
+    def build(self):
+        items = sorted(
+            Ingredient.objects.values("id", "name", "measurement_unit"),
+            key=lambda item: (item["name"].casefold(), item["id"]),
+        )
+        names = [(item["name"].casefold(), item) for item in items]
+        words = sorted(
+            (
+                (word, position)
+                for position, (key, _) in enumerate(names)
+                for word in key.split()[1:]
+            )
+        )
+        self._snapshot = (names, words, time.monotonic())
+        return self._snapshot
+
+    @staticmethod
+    def _is_fresh(snapshot):
+        return snapshot is not None and (
+            time.monotonic() - snapshot[2] <= settings.INGREDIENT_INDEX_TTL
+        )
+
+    def _ensure_built(self):
+        snapshot = self._snapshot
+        if not self._is_fresh(snapshot):
+            with self._lock:
+                # Пока ждали блокировку, индекс мог построить другой поток.
+                snapshot = self._snapshot
+                if not self._is_fresh(snapshot):
+                    snapshot = self.build()
+        return snapshot[0], snapshot[1]
+
+    def search(self, query, limit=None):
+        limit = limit or settings.INGREDIENT_AUTOCOMPLETE_LIMIT
+        query = query.strip().casefold()
+        names, words = self._ensure_built()
+        result = []
+        found = set()
+        for index in range(bisect_left(names, (query,)), len(names)):
+            key, item = names[index]
+            if len(result) >= limit or not key.startswith(query):
+                break
+            result.append(item)
+            found.add(index)
+        for index in range(bisect_left(words, (query,)), len(words)):
+            word, position = words[index]
+            if len(result) >= limit or not word.startswith(query):
+                break
+            if position not in found:
+                result.append(names[position][1])
+                found.add(position)
+        return result
+
+
+ingredient_index = IngredientIndex()
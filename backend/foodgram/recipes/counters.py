@@ -0,0 +1,45 @@
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from users.models import CustomUser, Follow
+
+from .models import Favorite, Recipe, ShoppingCart
+
+
+RECIPE_COUNTERS = {
+    Favorite: "favorites_count",
+    ShoppingCart: "in_carts_count",
+}
+
+
+def increment(queryset, field, delta):
+    """Атомарно меняет счётчик через F(), без чтения строки в Python.
+    Счётчик не уходит ниже нуля, если он успел разойтись с данными."""
+    if delta < 0:
+        queryset = queryset.filter(**{f"{field}__gte": -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def count_subquery(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(total=Count("pk"))
+            .values("total")
+        ),
+        Value(0),
+    )
+
+
+def rebuild_counters():
+    """Пересчитывает все денормализованные счётчики по исходным таблицам."""
+    Recipe.objects.update(
+        favorites_count=count_subquery(Favorite, "recipe"),
+        in_carts_count=count_subquery(ShoppingCart, "recipe"),
+    )
+    CustomUser.objects.update(
+        recipes_count=count_subquery(Recipe, "author"),
+        followers_count=count_subquery(Follow, "author"),
+    )
@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Рецепты изменены в обход save(): update() по счётчикам или картинкам.
+# Аргумент recipe_ids — список id затронутых рецептов.
+recipes_changed = Signal()
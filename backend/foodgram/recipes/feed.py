@@ -0,0 +1,134 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Exists, F, OuterRef, Q
+
+from users.models import CustomUser, Follow
+
+from .models import FeedEntry, Recipe
+
+BATCH_SIZE = 1000
+
+
+def is_fan_out_author(author_id):
+    """Рецепты авторов с большим числом подписчиков не раскладываются
+    по лентам при записи, а подмешиваются при чтении."""
+    return CustomUser.objects.filter(
+        pk=author_id,
+        followers_count__lte=settings.FEED_FANOUT_MAX_FOLLOWERS,
+    ).exists()
+
+
+def fan_out_recipe(recipe_id):
+    recipe = Recipe.objects.filter(pk=recipe_id).only(
+        "author_id", "pub_date"
+    ).first()
+    if recipe is None or not is_fan_out_author(recipe.author_id):
+        return
+    followers = Follow.objects.filter(author_id=recipe.author_id).values_list(
+        "user_id", flat=True
+    )
+    batch = []
+    for user_id in followers.iterator(chunk_size=BATCH_SIZE):
+        batch.append(FeedEntry(
+            user_id=user_id, recipe_id=recipe_id, pub_date=recipe.pub_date
+        ))
+        if len(batch) == BATCH_SIZE:
+            FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def schedule_fan_out(recipe):
+    transaction.on_commit(lambda: fan_out_recipe(recipe.pk))
+
+
+def add_author_to_feed(user_id, author_id):
+    """При подписке в ленту попадают последние рецепты автора."""
+    if not is_fan_out_author(author_id):
+        return
+    recipes = Recipe.objects.filter(author_id=author_id).values_list(
+        "pk", "pub_date"
+    )[:settings.FEED_BACKFILL_SIZE]
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(user_id=user_id, recipe_id=recipe_id, pub_date=pub_date)
+            for recipe_id, pub_date in recipes
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def fill_author_feeds(author_id):
+    """Раскладывает последние рецепты автора по лентам всех подписчиков."""
+    recipes = list(Recipe.objects.filter(author_id=author_id).values_list(
+        "pk", "pub_date"
+    )[:settings.FEED_BACKFILL_SIZE])
+    if not recipes:
+        return
+    followers = Follow.objects.filter(author_id=author_id).values_list(
+        "user_id", flat=True
+    )
+    batch = []
+    for user_id in followers.iterator(chunk_size=BATCH_SIZE):
+        batch.extend(
+            FeedEntry(user_id=user_id, recipe_id=recipe_id, pub_date=pub_date)
+            for recipe_id, pub_date in recipes
+        )
+        if len(batch) >= BATCH_SIZE:
+            FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def schedule_fill_after_unfollow(author_id):
+    """Пока у автора было больше FEED_FANOUT_MAX_FOLLOWERS подписчиков,
+    его рецепты в ленты не раскладывались. Когда отписка возвращает его
+    к порогу, ленты дополняются после коммита. Счётчик меняется под
+    блокировкой строки, поэтому значение, равное порогу, видит ровно
+    одна транзакция из тех, что уменьшили его до порога."""
+    followers_count = CustomUser.objects.filter(pk=author_id).values_list(
+        "followers_count", flat=True
+    ).first()
+    if followers_count == settings.FEED_FANOUT_MAX_FOLLOWERS:
+        transaction.on_commit(lambda: fill_author_feeds(author_id))
+
+
+def rebuild_feeds():
+    """Пересобирает ленты заново: по последним рецептам каждого автора
+    с раскладкой для всех его подписчиков."""
+    FeedEntry.objects.all().delete()
+    authors = (
+        Follow.objects.values("author")
+        .annotate(followers=Count("id"))
+        .filter(followers__lte=settings.FEED_FANOUT_MAX_FOLLOWERS)
+        .values_list("author", flat=True)
+    )
+    for author_id in authors.iterator(chunk_size=BATCH_SIZE):
+        fill_author_feeds(author_id)
+
+
+def remove_author_from_feed(user_id, author_id):
+    FeedEntry.objects.filter(
+        user_id=user_id, recipe__author_id=author_id
+    ).delete()
+
+
+def get_feed(user):
+    """Лента подписок, отсортированная по (-feed_date, -id).
+
+    Обычно это чтение готовых записей FeedEntry по индексу; рецепты
+    авторов без раскладки добавляются условием по автору."""
+    pull_authors = list(
+        Follow.objects.filter(
+            user=user,
+            author__followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS,
+        ).values_list("author_id", flat=True)
+    )
+    if not pull_authors:
+        return Recipe.objects.filter(feed_entries__user=user).annotate(
+            feed_date=F("feed_entries__pub_date")
+        ).order_by("-feed_date", "-id")
+    return Recipe.objects.filter(
+        Q(Exists(FeedEntry.objects.filter(user=user, recipe=OuterRef("pk"))))
+        | Q(author_id__in=pull_authors)
+    ).annotate(feed_date=F("pub_date")).order_by("-feed_date", "-id")
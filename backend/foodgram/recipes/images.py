@@ -0,0 +1,124 @@
+import io
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+from .events import recipes_changed
+from .models import Recipe, image_storage
+
+logger = logging.getLogger(__name__)
+
+VARIANTS = {
+    "thumbnail": settings.RECIPE_THUMBNAIL_SIZE,
+    "image_webp": settings.RECIPE_IMAGE_MAX_DIMENSION,
+}
+
+IMAGE_FIELDS = ("image", *VARIANTS)
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.RECIPE_IMAGE_WORKERS,
+    thread_name_prefix="recipe-images",
+)
+
+
+def render_variant(image, size):
+    variant = image.copy()
+    variant.thumbnail((size, size))
+    buffer = io.BytesIO()
+    variant.save(buffer, "WEBP", quality=settings.RECIPE_WEBP_QUALITY)
+    return ContentFile(buffer.getvalue())
+
+
+def build_variants(recipe_id):
+    """Строит уменьшенные WebP-копии картинки рецепта. Поля обновляются,
+    только если за это время картинку не заменили."""
+    try:
+        recipe = Recipe.objects.only(
+            "image", *VARIANTS
+        ).get(pk=recipe_id)
+        with recipe.image.open("rb") as file, Image.open(file) as image:
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA")
+            created = {
+                field: image_storage.save(
+                    f"recipes/variants/{field}.webp",
+                    render_variant(image, size),
+                )
+                for field, size in VARIANTS.items()
+            }
+        updated = Recipe.objects.filter(
+            pk=recipe_id, image=recipe.image.name
+        ).update(**created)
+        if updated:
+            recipes_changed.send(sender=Recipe, recipe_ids=[recipe_id])
+        stale = (
+            [getattr(recipe, field).name for field in VARIANTS]
+            if updated else created.values()
+        )
+        collect_orphans(stale)
+    except Recipe.DoesNotExist:
+        pass
+    except Exception:
+        logger.exception("Не удалось обработать картинку рецепта %s",
+                         recipe_id)
+
+
+def build_variants_in_worker(recipe_id):
+    try:
+        build_variants(recipe_id)
+    finally:
+        connection.close()
+
+
+def is_recent(name, now):
+    try:
+        modified = image_storage.get_modified_time(name).timestamp()
+    except FileNotFoundError:
+        return False
+    return now - modified < settings.RECIPE_IMAGE_ORPHAN_GRACE
+
+
+def collect_orphans(names):
+    """Удаляет файлы, на которые не ссылается ни один рецепт. Хранилище
+    общее для всех рецептов, поэтому число ссылок считается по всем
+    полям с картинками.
+
+    Недавно записанные файлы пропускаются: на них может ссылаться ещё не
+    закоммиченный рецепт (см. ContentAddressedStorage). Их подберёт
+    команда collect_orphan_images."""
+    names = {name for name in names if name}
+    if not names:
+        return
+    referenced = set()
+    for field in IMAGE_FIELDS:
+        referenced.update(
+            Recipe.objects.filter(**{f"{field}__in": names})
+            .values_list(field, flat=True)
+        )
+    # Время изменения проверяется после ссылок: повторная загрузка
+    # обновляет его раньше, чем ссылка на файл станет видна.
+    now = time.time()
+    for name in names - referenced:
+        if not is_recent(name, now):
+            image_storage.delete(name)
+
+
+def schedule_collect(names):
+    names = list(names)
+    transaction.on_commit(lambda: collect_orphans(names))
+
+
+def schedule_variants(recipe):
+    """Ставит обработку картинки в пул после фиксации транзакции."""
+    if settings.RECIPE_IMAGE_ASYNC:
+        transaction.on_commit(
+            lambda: executor.submit(build_variants_in_worker, recipe.pk)
+        )
+    else:
+        transaction.on_commit(lambda: build_variants(recipe.pk))
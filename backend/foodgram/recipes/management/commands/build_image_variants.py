@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from recipes.images import build_variants
+from recipes.models import Recipe
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        "Построение WebP-копий картинок рецептов, сохранённых до их "
+        "появления."
+    )
+
+    def handle(self, *args, **options):
+        missing = Recipe.objects.exclude(image="").filter(
+            Q(thumbnail="") | Q(image_webp="")
+        )
+        last_id = 0
+        total = 0
+        while True:
+            ids = list(
+                missing.filter(pk__gt=last_id)
+                .order_by("pk")
+                .values_list("pk", flat=True)[:BATCH_SIZE]
+            )
+            if not ids:
+                break
+            for recipe_id in ids:
+                build_variants(recipe_id)
+            last_id = ids[-1]
+            total += len(ids)
+        self.stdout.write(
+            self.style.SUCCESS(f"Обработано картинок: {total}")
+        )
@@ -0,0 +1,34 @@
+import posixpath
+
+from django.core.management.base import BaseCommand
+from recipes.images import collect_orphans
+from recipes.models import image_storage
+
+BATCH_SIZE = 1000
+
+
+def walk(directory):
+    directories, files = image_storage.listdir(directory)
+    for name in files:
+        yield posixpath.join(directory, name)
+    for name in directories:
+        yield from walk(posixpath.join(directory, name))
+
+
+class Command(BaseCommand):
+    help = (
+        "Удаление картинок рецептов, на которые не осталось ссылок "
+        "и которые старше RECIPE_IMAGE_ORPHAN_GRACE."
+    )
+
+    def handle(self, *args, **options):
+        if not image_storage.exists("recipes"):
+            return
+        batch = []
+        for name in walk("recipes"):
+            batch.append(name)
+            if len(batch) == BATCH_SIZE:
+                collect_orphans(batch)
+                batch = []
+        collect_orphans(batch)
+        self.stdout.write(self.style.SUCCESS("Осиротевшие картинки удалены"))
@@ -1,18 +1,104 @@
 import csv
+import json
+from itertools import islice
+from pathlib import Path
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from recipes.models import Ingredient
+from recipes.signals import ingredients_imported
+
+DEFAULT_PATH = Path(__file__).resolve().parents[2] / "data" / "ingredients.csv"
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    reader = csv.reader(file)
+    try:
+        for row in reader:
+            if not row:
+                continue
+            if len(row) != 2:
+                raise CommandError(
+                    f"Строка {reader.line_num}: ожидается два поля "
+                    f"(название и единица измерения), получено {len(row)}."
+                )
+            yield tuple(row)
+    except csv.Error as error:
+        raise CommandError(f"Строка {reader.line_num}: {error}")
+
+
+def read_json(file):
+    """Читает JSON-массив объектов по частям, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(JSON_CHUNK_SIZE).lstrip()
+    if not buffer.startswith("["):
+        raise CommandError("Ожидается JSON-массив ингредиентов.")
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip().removeprefix(",").lstrip()
+        if buffer.startswith("]"):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            chunk = file.read(JSON_CHUNK_SIZE)
+            if not chunk:
+                raise CommandError("Некорректный JSON-файл.")
+            buffer += chunk
+            continue
+        try:
+            name, measurement_unit = item["name"], item["measurement_unit"]
+        except (KeyError, TypeError):
+            raise CommandError(f"Некорректный ингредиент в JSON: {item!r}")
+        yield name, measurement_unit
+        buffer = buffer[end:]
+
+
+READERS = {".csv": read_csv, ".json": read_json}
 
 
 class Command(BaseCommand):
-    help = '''Загрузка инфы из csv в б/д. '''
+    help = '''Загрузка ингредиентов из csv или json в б/д. '''
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--path",
+            type=Path,
+            default=DEFAULT_PATH,
+            help="Путь к файлу .csv или .json",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Количество строк в одном INSERT",
+        )
 
     def handle(self, *args, **options):
-        with open('recipes/data/ingredients.csv', encoding='utf-8') as file:
-            file_reader = csv.reader(file)
-            for row in file_reader:
-                name, measurement_unit = row
-                Ingredient.objects.get_or_create(
-                    name=name,
-                    measurement_unit=measurement_unit
+        path = options["path"]
+        batch_size = options["batch_size"]
+        if batch_size <= 0:
+            raise CommandError("--batch-size должен быть больше нуля")
+        reader = READERS.get(path.suffix.lower())
+        if reader is None:
+            raise CommandError("Поддерживаются только файлы .csv и .json")
+        if not path.exists():
+            raise CommandError(f"Файл {path} не найден")
+        total = 0
+        with open(path, encoding="utf-8") as file:
+            rows = reader(file)
+            while batch := list(islice(rows, batch_size)):
+                Ingredient.objects.bulk_create(
+                    [
+                        Ingredient(name=name,
+                                   measurement_unit=measurement_unit)
+                        for name, measurement_unit in batch
+                    ],
+                    ignore_conflicts=True,
                 )
+                total += len(batch)
+                self.stdout.write(f"Обработано строк: {total}")
+        ingredients_imported.send(sender=Ingredient)
+        self.stdout.write(self.style.SUCCESS(
+            f"Загрузка завершена, строк в файле: {total}"
+        ))
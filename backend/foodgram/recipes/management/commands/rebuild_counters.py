@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from recipes.counters import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчёт счётчиков избранного, списков покупок, рецептов "
+        "и подписчиков."
+    )
+
+    def handle(self, *args, **options):
+        rebuild_counters()
+        self.stdout.write(self.style.SUCCESS("Счётчики пересчитаны"))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from recipes.feed import rebuild_feeds
+
+
+class Command(BaseCommand):
+    help = """Пересборка лент подписок по подпискам и рецептам."""
+
+    def handle(self, *args, **options):
+        rebuild_feeds()
+        self.stdout.write(self.style.SUCCESS("Ленты пересобраны"))
@@ -0,0 +1,82 @@
+import heapq
+import threading
+import time
+from array import array
+from collections import Counter, defaultdict
+
+from django.conf import settings
+
+from foodgram.db_router import use_primary
+
+from .models import RecipeIngredients
+
+
+class RecipeMatchIndex:
+    """Инвертированный индекс «ингредиент -> рецепты» в памяти процесса.
+
+    Для набора ингредиентов пользователя считает, сколько ингредиентов
+    каждого рецепта у него есть, проходя только по спискам этих
+    ингредиентов, а не по всем рецептам. Индекс перестраивается лениво:
+    после изменений не чаще раза в MATCH_INDEX_REBUILD_INTERVAL секунд и
+    безусловно раз в MATCH_INDEX_TTL (изменения из других процессов)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = None
+        self._sizes = None
+        self._built_at = 0.0
+        self._dirty = False
+
+    def invalidate(self):
+        self._dirty = True
+
+    @use_primary()
+    def build(self):
+        postings = defaultdict(lambda: array("Q"))
+        sizes = Counter()
+        rows = RecipeIngredients.objects.values_list(
+            "recipe_id", "ingredient_id"
+        ).order_by()
+        for recipe_id, ingredient_id in rows.iterator(chunk_size=10000):
+            postings[ingredient_id].append(recipe_id)
+            sizes[recipe_id] += 1
+        self._postings, self._sizes = dict(postings), sizes
+        self._built_at = time.monotonic()
+        self._dirty = False
+
+    def _needs_build(self):
+        age = time.monotonic() - self._built_at
+        return (
+            self._postings is None
+            or age > settings.MATCH_INDEX_TTL
+            or (self._dirty and age > settings.MATCH_INDEX_REBUILD_INTERVAL)
+        )
+
+    def match(self, ingredient_ids, limit=None):
+        """Возвращает [(recipe_id, есть, не хватает)], сначала рецепты, где
+        не хватает меньше всего ингредиентов, затем с большим покрытием."""
+        limit = limit or settings.MATCH_RESULTS_LIMIT
+        if self._needs_build():
+            with self._lock:
+                if self._needs_build():
+                    self.build()
+        postings, sizes = self._postings, self._sizes
+        matched = Counter()
+        for ingredient_id in set(ingredient_ids):
+            matched.update(postings.get(ingredient_id, ()))
+        best = heapq.nsmallest(
+            limit,
+            matched.items(),
+            key=lambda item: (
+                sizes[item[0]] - item[1],
+                -item[1] / sizes[item[0]],
+                -item[0],
+            ),
+        )
+        return [
+            (recipe_id, count, sizes[recipe_id] - count)
+            for recipe_id, count in best
+        ]
+
+
+recipe_match_index = RecipeMatchIndex()
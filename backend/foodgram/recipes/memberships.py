@@ -0,0 +1,174 @@
+"""Множества id избранного, списка покупок и подписок пользователя.
+
+Флаги is_favorited, is_in_shopping_cart и is_subscribed проверяются
+по ним в памяти, без запроса на каждый объект. Множества хранятся в
+общем кэше упакованными в массив чисел под ключом с версией, как ответы
+в api.cache: запись меняет версию после коммита, а множество под новой
+версией читается из БД одним запросом и кладётся через add(), так что
+прочитанное до записи уже никто не увидит.
+
+Смену версии в LocMemCache другие процессы не увидят, поэтому без общего
+кэша (settings.SHARED_CACHE) множества читаются из БД на каждый запрос:
+по одному запросу на множество вместо запроса на объект."""
+
+import uuid
+from array import array
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from foodgram.db_router import use_primary
+from users.models import Follow
+
+from .models import Favorite, ShoppingCart
+
+MEMBERSHIP_KEY = "memberships:{}:{}:{}"
+MEMBERSHIP_VERSION_KEY = "memberships:{}:{}:version"
+MEMBERSHIP_FIELDS = {
+    Favorite: "recipe_id",
+    ShoppingCart: "recipe_id",
+    Follow: "author_id",
+}
+
+
+def membership_key(model, user_id, version):
+    return MEMBERSHIP_KEY.format(model._meta.label_lower, user_id, version)
+
+
+def membership_version_key(model, user_id):
+    return MEMBERSHIP_VERSION_KEY.format(model._meta.label_lower, user_id)
+
+
+def missing_versions(keys, versions):
+    return {key: uuid.uuid4().hex for key in keys if key not in versions}
+
+
+def pack(ids):
+    return array("q", sorted(ids)).tobytes()
+
+
+def unpack(data):
+    ids = array("q")
+    ids.frombytes(data)
+    return frozenset(ids)
+
+
+class UserMemberships:
+    def __init__(self, user):
+        self.user_id = (
+            user.pk if user is not None and user.is_authenticated else None
+        )
+        self._sets = {}
+
+    @property
+    def favorites(self):
+        return self.get(Favorite)
+
+    @property
+    def cart(self):
+        return self.get(ShoppingCart)
+
+    @property
+    def follows(self):
+        return self.get(Follow)
+
+    def get(self, model):
+        if model not in self._sets:
+            self.load((model,))
+        return self._sets[model]
+
+    def version_keys(self, models):
+        missing = [model for model in models if model not in self._sets]
+        if self.user_id is None:
+            self._sets.update(dict.fromkeys(missing, frozenset()))
+            return {}
+        return {membership_version_key(model, self.user_id): model
+                for model in missing}
+
+    def data_keys(self, version_keys, versions):
+        return {
+            membership_key(model, self.user_id, versions[key]): model
+            for key, model in version_keys.items()
+        }
+
+    def queryset(self, model):
+        return model.objects.filter(user_id=self.user_id).values_list(
+            MEMBERSHIP_FIELDS[model], flat=True
+        )
+
+    def load(self, models=tuple(MEMBERSHIP_FIELDS)):
+        """Загружает множества двумя обращениями к кэшу (версии и данные);
+        недостающие читаются из БД. Без общего кэша — сразу из БД."""
+        version_keys = self.version_keys(models)
+        if not version_keys:
+            return self
+        if not settings.SHARED_CACHE:
+            for model in version_keys.values():
+                self._sets[model] = frozenset(self.queryset(model))
+            return self
+        versions = cache.get_many(version_keys)
+        missing = missing_versions(version_keys, versions)
+        if missing:
+            cache.set_many(missing, None)
+        keys = self.data_keys(version_keys, {**versions, **missing})
+        cached = cache.get_many(keys)
+        for key, model in keys.items():
+            if key in cached:
+                self._sets[model] = unpack(cached[key])
+                continue
+            with use_primary():
+                self._sets[model] = frozenset(self.queryset(model))
+            cache.add(key, pack(self._sets[model]),
+                      settings.MEMBERSHIP_CACHE_TIMEOUT)
+        return self
+
+    async def aload(self, models=tuple(MEMBERSHIP_FIELDS)):
+        version_keys = self.version_keys(models)
+        if not version_keys:
+            return self
+        if not settings.SHARED_CACHE:
+            for model in version_keys.values():
+                self._sets[model] = frozenset(
+                    [pk async for pk in self.queryset(model)]
+                )
+            return self
+        versions = await cache.aget_many(version_keys)
+        missing = missing_versions(version_keys, versions)
+        if missing:
+            await cache.aset_many(missing, None)
+        keys = self.data_keys(version_keys, {**versions, **missing})
+        cached = await cache.aget_many(keys)
+        for key, model in keys.items():
+            if key in cached:
+                self._sets[model] = unpack(cached[key])
+                continue
+            with use_primary():
+                self._sets[model] = frozenset(
+                    [pk async for pk in self.queryset(model)]
+                )
+            await cache.aadd(key, pack(self._sets[model]),
+                             settings.MEMBERSHIP_CACHE_TIMEOUT)
+        return self
+
+
+def memberships_for(request):
+    """Множества текущего пользователя, одни на весь запрос."""
+    if request is None:
+        return UserMemberships(None)
+    memberships = getattr(request, "_memberships", None)
+    if memberships is None:
+        memberships = UserMemberships(request.user)
+        request._memberships = memberships
+    return memberships
+
+
+async def amemberships_for(request):
+    return await memberships_for(request).aload()
+
+
+def invalidate_members(model, user_id):
+    """Меняет версию множества после коммита, когда изменение уже видно
+    в БД. Параллельные записи не теряются: каждая просто меняет версию."""
+    key = membership_version_key(model, user_id)
+    transaction.on_commit(lambda: cache.set(key, uuid.uuid4().hex, None))
@@ -0,0 +1,42 @@
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+BATCH_SIZE = 500
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model("recipes", "Ingredient")
+    RecipeIngredients = apps.get_model("recipes", "RecipeIngredients")
+    duplicates = (
+        Ingredient.objects.values("name", "measurement_unit")
+        .annotate(keep_id=Min("id"), total=Count("id"))
+        .filter(total__gt=1)
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+    for group in duplicates:
+        extra = Ingredient.objects.filter(
+            name=group["name"], measurement_unit=group["measurement_unit"]
+        ).exclude(id=group["keep_id"])
+        RecipeIngredients.objects.filter(ingredient__in=extra).update(
+            ingredient_id=group["keep_id"]
+        )
+        extra.delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0009_alter_shoppingcart_user"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name="ingredient",
+            constraint=models.UniqueConstraint(
+                fields=("name", "measurement_unit"),
+                name="ingredient_name_unit_unique",
+            ),
+        ),
+    ]
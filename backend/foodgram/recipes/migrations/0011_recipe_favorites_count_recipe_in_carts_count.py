@@ -0,0 +1,55 @@
+# Generated by Django 4.2.4 on 2026-10-17 06:59
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_subquery(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(total=Count("pk"))
+            .values("total")
+        ),
+        Value(0),
+    )
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model("recipes", "Recipe")
+    Favorite = apps.get_model("recipes", "Favorite")
+    ShoppingCart = apps.get_model("recipes", "ShoppingCart")
+    User = apps.get_model("users", "CustomUser")
+    Recipe.objects.update(
+        favorites_count=count_subquery(Favorite, "recipe"),
+        in_carts_count=count_subquery(ShoppingCart, "recipe"),
+    )
+    User.objects.update(recipes_count=count_subquery(Recipe, "author"))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0005_customuser_recipes_count"),
+        ("recipes", "0010_ingredient_name_unit_unique"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="favorites_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="в избранном"
+            ),
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="in_carts_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="в списках покупок"
+            ),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.4 on 2026-10-17 07:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0012_recipe_pub_date"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="image_webp",
+            field=models.ImageField(
+                blank=True,
+                editable=False,
+                upload_to="recipes/variants/",
+                verbose_name="фото рецепта в WebP",
+            ),
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="thumbnail",
+            field=models.ImageField(
+                blank=True,
+                editable=False,
+                upload_to="recipes/variants/",
+                verbose_name="миниатюра",
+            ),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.4 on 2026-10-17 07:09
+
+from django.db import migrations, models
+import recipes.storage
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0013_recipe_image_variants"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="recipe",
+            name="image",
+            field=models.ImageField(
+                db_index=True,
+                storage=recipes.storage.ContentAddressedStorage(),
+                upload_to="recipes/",
+                verbose_name="фото рецепта",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="recipe",
+            name="image_webp",
+            field=models.ImageField(
+                blank=True,
+                db_index=True,
+                editable=False,
+                storage=recipes.storage.ContentAddressedStorage(),
+                upload_to="recipes/variants/",
+                verbose_name="фото рецепта в WebP",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="recipe",
+            name="thumbnail",
+            field=models.ImageField(
+                blank=True,
+                db_index=True,
+                editable=False,
+                storage=recipes.storage.ContentAddressedStorage(),
+                upload_to="recipes/variants/",
+                verbose_name="миниатюра",
+            ),
+        ),
+    ]
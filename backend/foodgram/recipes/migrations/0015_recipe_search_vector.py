@@ -0,0 +1,45 @@
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+SEARCH_CONFIG = "russian"
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    Recipe = apps.get_model("recipes", "Recipe")
+    Recipe.objects.update(
+        search_vector=(
+            SearchVector("name", weight="A", config=SEARCH_CONFIG)
+            + SearchVector("text", weight="B", config=SEARCH_CONFIG)
+        )
+    )
+    schema_editor.execute(
+        "CREATE INDEX recipe_search_vector_gin ON recipes_recipe "
+        "USING gin (search_vector)"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS recipe_search_vector_gin")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0014_recipe_content_addressed_images"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        # GIN-индекс есть только в PostgreSQL, на SQLite поиск идёт через
+        # индекс в памяти (recipes.search.RecipeSearchIndex).
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,66 @@
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+BATCH_SIZE = 1000
+
+
+def delete_duplicates(model):
+    duplicates = (
+        model.objects.values("user", "recipe")
+        .annotate(keep_id=Min("id"), total=Count("id"))
+        .filter(total__gt=1)
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+    for group in duplicates:
+        model.objects.filter(
+            user=group["user"], recipe=group["recipe"]
+        ).exclude(id=group["keep_id"]).delete()
+
+
+def count_subquery(model):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(recipe=OuterRef("pk"))
+            .order_by()
+            .values("recipe")
+            .annotate(total=Count("pk"))
+            .values("total")
+        ),
+        Value(0),
+    )
+
+
+def deduplicate(apps, schema_editor):
+    Favorite = apps.get_model("recipes", "Favorite")
+    ShoppingCart = apps.get_model("recipes", "ShoppingCart")
+    Recipe = apps.get_model("recipes", "Recipe")
+    delete_duplicates(Favorite)
+    delete_duplicates(ShoppingCart)
+    Recipe.objects.update(
+        favorites_count=count_subquery(Favorite),
+        in_carts_count=count_subquery(ShoppingCart),
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0015_recipe_search_vector"),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="favorite",
+            constraint=models.UniqueConstraint(
+                fields=("user", "recipe"), name="favorite_user_recipe_unique"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="shoppingcart",
+            constraint=models.UniqueConstraint(
+                fields=("user", "recipe"),
+                name="shopping_cart_user_recipe_unique",
+            ),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 4.2.4 on 2026-10-17 07:15
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Q, Sum
+
+BATCH_SIZE = 1000
+
+
+def delete_groups(model, fields, groups, sum_field=None):
+    if sum_field:
+        # Как при слиянии ингредиентов в 0010: количество дублей
+        # складывается в оставшуюся строку.
+        model.objects.bulk_update(
+            [
+                model(id=group["keep_id"], **{sum_field: group["sum"]})
+                for group in groups
+            ],
+            [sum_field],
+        )
+    condition = Q()
+    for group in groups:
+        condition |= Q(**{field: group[field] for field in fields})
+    model.objects.filter(condition).exclude(
+        id__in=[group["keep_id"] for group in groups]
+    ).delete()
+
+
+def delete_duplicates(model, fields, sum_field=None):
+    duplicates = (
+        model.objects.values(*fields)
+        .annotate(keep_id=Min("id"), total=Count("id"))
+        .filter(total__gt=1)
+        .order_by()
+    )
+    if sum_field:
+        duplicates = duplicates.annotate(sum=Sum(sum_field))
+    batch = []
+    for group in duplicates.iterator(chunk_size=BATCH_SIZE):
+        batch.append(group)
+        if len(batch) == BATCH_SIZE:
+            delete_groups(model, fields, batch, sum_field)
+            batch = []
+    if batch:
+        delete_groups(model, fields, batch, sum_field)
+
+
+def deduplicate(apps, schema_editor):
+    delete_duplicates(
+        apps.get_model("recipes", "RecipeIngredients"),
+        ("recipe", "ingredient"),
+        sum_field="amount",
+    )
+    delete_duplicates(apps.get_model("recipes", "RecipeTags"), ("recipe", "tag"))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0016_favorite_shoppingcart_unique"),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="recipetags",
+            index=models.Index(fields=["tag", "recipe"], name="tag_recipe_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="recipeingredients",
+            constraint=models.UniqueConstraint(
+                fields=("recipe", "ingredient"), name="recipe_ingredient_unique"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="recipetags",
+            constraint=models.UniqueConstraint(
+                fields=("recipe", "tag"), name="recipe_tag_unique"
+            ),
+        ),
+    ]
@@ -0,0 +1,99 @@
+# Generated by Django 4.2.4 on 2026-10-17 07:17
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count
+
+BATCH_SIZE = 1000
+
+
+def fill_feeds(apps, schema_editor):
+    Follow = apps.get_model("users", "Follow")
+    Recipe = apps.get_model("recipes", "Recipe")
+    FeedEntry = apps.get_model("recipes", "FeedEntry")
+    authors = (
+        Follow.objects.values("author")
+        .annotate(followers=Count("id"))
+        .filter(followers__lte=settings.FEED_FANOUT_MAX_FOLLOWERS)
+        .values_list("author", flat=True)
+    )
+    for author_id in authors.iterator(chunk_size=BATCH_SIZE):
+        recipes = list(
+            Recipe.objects.filter(author_id=author_id)
+            .order_by("-pub_date", "-id")
+            .values_list("pk", "pub_date")[: settings.FEED_BACKFILL_SIZE]
+        )
+        followers = Follow.objects.filter(author_id=author_id).values_list(
+            "user_id", flat=True
+        )
+        FeedEntry.objects.bulk_create(
+            [
+                FeedEntry(user_id=user_id, recipe_id=recipe_id, pub_date=pub_date)
+                for user_id in followers
+                for recipe_id, pub_date in recipes
+            ],
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("recipes", "0017_recipe_through_unique"),
+        ("users", "0005_customuser_recipes_count"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FeedEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("pub_date", models.DateTimeField(verbose_name="Дата публикации")),
+                (
+                    "recipe",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="feed_entries",
+                        to="recipes.recipe",
+                        verbose_name="Рецепт",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="feed_entries",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Подписчик",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Запись ленты",
+                "verbose_name_plural": "Лента подписок",
+                "indexes": [
+                    models.Index(
+                        fields=["user", "-pub_date", "-recipe"],
+                        name="feed_entry_user_pub_date_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="feedentry",
+            constraint=models.UniqueConstraint(
+                fields=("user", "recipe"), name="feed_entry_user_recipe_unique"
+            ),
+        ),
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,15 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models import Prefetch
+
+from .storage import ContentAddressedStorage
 
 User = get_user_model()
 
+image_storage = ContentAddressedStorage()
+
 
 class Tag(models.Model):
     name = models.CharField(
@@ -37,11 +43,32 @@ class Ingredient(models.Model):
 
     class Meta:
         ordering = ("name",)
+        constraints = (
+            models.UniqueConstraint(
+                fields=("name", "measurement_unit"),
+                name="ingredient_name_unit_unique",
+            ),
+        )
 
     def __str__(self):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    def with_related(self):
+        """Подтягивает автора, тэги и ингредиенты фиксированным числом
+        запросов, независимо от размера выборки."""
+        return self.select_related("author").prefetch_related(
+            "tags",
+            Prefetch(
+                "recipe_ingredients",
+                queryset=RecipeIngredients.objects.select_related(
+                    "ingredient"
+                ),
+            ),
+        )
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User,
@@ -59,6 +86,24 @@ class Recipe(models.Model):
         verbose_name="фото рецепта",
         blank=False,
         upload_to="recipes/",
+        storage=image_storage,
+        db_index=True,
+    )
+    thumbnail = models.ImageField(
+        verbose_name="миниатюра",
+        upload_to="recipes/variants/",
+        storage=image_storage,
+        blank=True,
+        editable=False,
+        db_index=True,
+    )
+    image_webp = models.ImageField(
+        verbose_name="фото рецепта в WebP",
+        upload_to="recipes/variants/",
+        storage=image_storage,
+        blank=True,
+        editable=False,
+        db_index=True,
     )
     text = models.TextField(
         verbose_name="описание рецепта",
@@ -80,6 +125,35 @@ class Recipe(models.Model):
         blank=False,
         validators=[MinValueValidator(1), MaxValueValidator(100)],
     )
+    pub_date = models.DateTimeField(
+        verbose_name="дата публикации",
+        auto_now_add=True,
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+    )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name="в избранном",
+        default=0,
+        editable=False,
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name="в списках покупок",
+        default=0,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
+
+    class Meta:
+        ordering = ("-pub_date", "-id")
+        indexes = (
+            models.Index(
+                fields=("-pub_date", "-id"),
+                name="recipe_pub_date_id_idx",
+            ),
+        )
 
     def __str__(self):
         return self.name
@@ -99,6 +173,14 @@ class RecipeIngredients(models.Model):
         null=True,
     )
 
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=("recipe", "ingredient"),
+                name="recipe_ingredient_unique",
+            ),
+        )
+
 
 class RecipeTags(models.Model):
     tag = models.ForeignKey(
@@ -112,6 +194,16 @@ class RecipeTags(models.Model):
         verbose_name="рецепт",
     )
 
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=("recipe", "tag"), name="recipe_tag_unique"
+            ),
+        )
+        indexes = (
+            models.Index(fields=("tag", "recipe"), name="tag_recipe_idx"),
+        )
+
     def __str__(self):
         return f"{self.tag} + {self.recipe}"
 
@@ -133,6 +225,11 @@ class Favorite(models.Model):
     class Meta:
         verbose_name = "Избранное"
         verbose_name_plural = "Избранное"
+        constraints = (
+            models.UniqueConstraint(
+                fields=("user", "recipe"), name="favorite_user_recipe_unique"
+            ),
+        )
 
     def __str__(self):
         return f"{self.user} добавил {self.recipe} в избранное!"
@@ -155,6 +252,51 @@ class ShoppingCart(models.Model):
     class Meta:
         verbose_name = "Список покупок"
         verbose_name_plural = "Списки покупок"
+        constraints = (
+            models.UniqueConstraint(
+                fields=("user", "recipe"),
+                name="shopping_cart_user_recipe_unique",
+            ),
+        )
 
     def __str__(self):
         return f"{self.user} добавил {self.recipe} в списки покупок!"
+
+
+class FeedEntry(models.Model):
+    """Рецепт в ленте подписчика, разложенный при публикации.
+
+    pub_date копируется из рецепта, чтобы лента читалась по индексу
+    (user, pub_date, recipe) без сортировки."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name="Подписчик",
+        related_name="feed_entries",
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name="Рецепт",
+        related_name="feed_entries",
+    )
+    pub_date = models.DateTimeField(verbose_name="Дата публикации")
+
+    class Meta:
+        verbose_name = "Запись ленты"
+        verbose_name_plural = "Лента подписок"
+        constraints = (
+            models.UniqueConstraint(
+                fields=("user", "recipe"), name="feed_entry_user_recipe_unique"
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=("user", "-pub_date", "-recipe"),
+                name="feed_entry_user_pub_date_idx",
+            ),
+        )
+
+    def __str__(self):
+        return f"{self.recipe} в ленте {self.user}"
@@ -0,0 +1,151 @@
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+)
+from django.db import connections
+from django.db.models import Case, F, IntegerField, When
+
+from .models import Recipe
+
+TOKEN_RE = re.compile(r"\w+")
+NAME_WEIGHT = 1.0
+TEXT_WEIGHT = 0.4
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.casefold())
+
+
+def is_postgres(using):
+    return connections[using].vendor == "postgresql"
+
+
+def search_vector():
+    config = settings.RECIPE_SEARCH_CONFIG
+    return (
+        SearchVector("name", weight="A", config=config)
+        + SearchVector("text", weight="B", config=config)
+    )
+
+
+class RecipeSearchIndex:
+    """Инвертированный индекс рецептов в памяти процесса — запасной
+    вариант полнотекстового поиска для баз без tsvector (SQLite).
+
+    Хранит для каждого слова веса вхождений по рецептам; название весит
+    больше описания. Ранжирование — сумма tf-idf по словам запроса,
+    в выдачу попадают рецепты, содержащие все слова."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = None
+        self._documents = {}
+
+    def invalidate(self):
+        self._postings = None
+
+    def _tokens(self, name, text):
+        weights = Counter()
+        for token in tokenize(name):
+            weights[token] += NAME_WEIGHT
+        for token in tokenize(text):
+            weights[token] += TEXT_WEIGHT
+        return weights
+
+    def _add(self, postings, recipe_id, name, text):
+        weights = self._tokens(name, text)
+        for token, weight in weights.items():
+            postings[token][recipe_id] = weight
+        self._documents[recipe_id] = tuple(weights)
+
+    def _remove(self, postings, recipe_id):
+        for token in self._documents.pop(recipe_id, ()):
+            postings[token].pop(recipe_id, None)
+
+    def build(self, using):
+        postings = defaultdict(dict)
+        self._documents = {}
+        rows = Recipe.objects.using(using).values_list("id", "name", "text")
+        for recipe_id, name, text in rows.iterator(chunk_size=2000):
+            self._add(postings, recipe_id, name, text)
+        self._postings = postings
+        return postings
+
+    def update(self, recipe):
+        with self._lock:
+            if self._postings is not None:
+                self._remove(self._postings, recipe.pk)
+                self._add(self._postings, recipe.pk, recipe.name, recipe.text)
+
+    def remove(self, recipe_id):
+        with self._lock:
+            if self._postings is not None:
+                self._remove(self._postings, recipe_id)
+
+    def search(self, query, using, limit):
+        with self._lock:
+            postings = self._postings or self.build(using)
+            terms = set(tokenize(query))
+            if not terms:
+                return []
+            matches = [postings.get(term, {}) for term in terms]
+            candidates = set.intersection(*(set(match) for match in matches))
+            total = len(self._documents) or 1
+            scores = {
+                recipe_id: sum(
+                    match[recipe_id] * math.log(1 + total / len(match))
+                    for match in matches
+                )
+                for recipe_id in candidates
+            }
+        return sorted(scores, key=lambda pk: (-scores[pk], -pk))[:limit]
+
+
+recipe_search_index = RecipeSearchIndex()
+
+
+def update_search_vectors(queryset):
+    """Пересчитывает сохранённый tsvector для выборки; на других базах
+    сбрасывает индекс в памяти, он перестроится при следующем поиске.
+    Нужна после массовых вставок, которые не шлют сигналы."""
+    if is_postgres(queryset.db):
+        queryset.update(search_vector=search_vector())
+    else:
+        recipe_search_index.invalidate()
+
+
+def index_recipe(recipe):
+    recipes = Recipe.objects.filter(pk=recipe.pk)
+    if is_postgres(recipes.db):
+        update_search_vectors(recipes)
+    else:
+        recipe_search_index.update(recipe)
+
+
+def search_recipes(queryset, query):
+    """Фильтрует выборку по запросу и сортирует по релевантности."""
+    if is_postgres(queryset.db):
+        search_query = SearchQuery(
+            query,
+            config=settings.RECIPE_SEARCH_CONFIG,
+            search_type="websearch",
+        )
+        return queryset.filter(search_vector=search_query).annotate(
+            rank=SearchRank(F("search_vector"), search_query)
+        ).order_by("-rank", "-pub_date", "-id")
+    ids = recipe_search_index.search(
+        query, queryset.db, settings.RECIPE_SEARCH_FALLBACK_LIMIT
+    )
+    return queryset.filter(pk__in=ids).order_by(
+        Case(
+            *(When(pk=pk, then=position) for position, pk in enumerate(ids)),
+            output_field=IntegerField(),
+        )
+    )
@@ -0,0 +1,144 @@
+import csv
+import io
+import os
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Sum
+
+from .models import RecipeIngredients
+
+INGREDIENT_FIELDS = ("ingredient__name", "ingredient__measurement_unit")
+HEADER = ("Ingredient_name", "measurement_unit", "Amount")
+HEADER_BY_RECIPE = ("Recipe",) + HEADER
+EXPORT_CHUNK_SIZE = 2000
+# Сколько строк выгрузки забирается из потока за один переход под ASGI.
+ASYNC_EXPORT_BATCH = 500
+PDF_FONT_NAME = "ShoppingListFont"
+PDF_LINE_HEIGHT = 16
+PDF_MARGIN = 40
+
+
+def get_cart_ingredients(user):
+    return RecipeIngredients.objects.filter(
+        recipe__shopping_cart_recipe__user=user
+    )
+
+
+def get_shopping_list(user):
+    """Список покупок: одна строка на пару (ингредиент, единица измерения),
+    количество суммируется на стороне базы данных."""
+    return (
+        get_cart_ingredients(user)
+        .values_list(*INGREDIENT_FIELDS)
+        .annotate(total_amount=Sum("amount"))
+        .order_by(*INGREDIENT_FIELDS)
+    )
+
+
+def get_shopping_list_by_recipe(user):
+    """Тот же список с разбивкой по рецептам. Группировка идёт по id
+    рецепта: одноимённые рецепты не сливаются в одну строку. Первым
+    полем строки идёт id, в выгрузку попадает только название."""
+    return (
+        get_cart_ingredients(user)
+        .values_list("recipe_id", "recipe__name", *INGREDIENT_FIELDS)
+        .annotate(total_amount=Sum("amount"))
+        .order_by("recipe__name", "recipe_id", *INGREDIENT_FIELDS)
+    )
+
+
+class Echo:
+    """Псевдо-файл для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def render_csv(rows, header):
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def render_txt(rows, header):
+    for *recipe, name, measurement_unit, amount in rows:
+        prefix = f"{recipe[0]}: " if recipe else ""
+        yield f"{prefix}{name} ({measurement_unit}) — {amount}\n"
+
+
+def get_pdf_font():
+    font_path = settings.SHOPPING_LIST_PDF_FONT
+    if not font_path or not os.path.exists(font_path):
+        return "Helvetica"
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+
+    if PDF_FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(PDF_FONT_NAME, font_path))
+    return PDF_FONT_NAME
+
+
+def render_pdf(rows, header):
+    """PDF собирается постранично из итератора строк; таблица
+    перекрёстных ссылок пишется в конце файла, поэтому документ
+    отдаётся одним куском после последней страницы."""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    font = get_pdf_font()
+    width, height = A4
+    y = height - PDF_MARGIN
+    pdf.setFont(font, 12)
+    for line in render_txt(rows, header):
+        if y < PDF_MARGIN:
+            pdf.showPage()
+            pdf.setFont(font, 12)
+            y = height - PDF_MARGIN
+        pdf.drawString(PDF_MARGIN, y, line.rstrip("\n"))
+        y -= PDF_LINE_HEIGHT
+    pdf.save()
+    yield buffer.getvalue()
+
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", render_csv),
+    "txt": ("text/plain; charset=utf-8", render_txt),
+    "pdf": ("application/pdf", render_pdf),
+}
+
+
+def export_shopping_list(user, file_format, by_recipe=False):
+    """Возвращает (content_type, генератор чанков) для выгрузки списка
+    покупок. Строки читаются из базы порциями по EXPORT_CHUNK_SIZE."""
+    content_type, render = EXPORT_FORMATS[file_format]
+    if by_recipe:
+        rows = (
+            row[1:]
+            for row in get_shopping_list_by_recipe(user).iterator(
+                chunk_size=EXPORT_CHUNK_SIZE
+            )
+        )
+        return content_type, render(rows, HEADER_BY_RECIPE)
+    rows = get_shopping_list(user).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    return content_type, render(rows, HEADER)
+
+
+async def aiter_export(content):
+    """Асинхронная обёртка над генератором выгрузки для ASGI.
+
+    Синхронный итератор StreamingHttpResponse под ASGI вычитывает целиком
+    через sync_to_async(list) до первого байта. Здесь строки забираются
+    порциями по ASYNC_EXPORT_BATCH в том же потоке, где работало
+    представление, — там и курсор базы."""
+    content = iter(content)
+    take = sync_to_async(lambda: list(islice(content, ASYNC_EXPORT_BATCH)))
+    while True:
+        batch = await take()
+        if not batch:
+            return
+        yield "".join(batch) if isinstance(batch[0], str) else b"".join(batch)
@@ -0,0 +1,157 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import Signal, receiver
+
+from users.models import CustomUser, Follow
+
+from .autocomplete import ingredient_index
+from .counters import RECIPE_COUNTERS, increment
+from .feed import (
+    add_author_to_feed,
+    remove_author_from_feed,
+    schedule_fan_out,
+    schedule_fill_after_unfollow,
+)
+from .images import IMAGE_FIELDS, schedule_collect
+from .matching import recipe_match_index
+from .memberships import invalidate_members
+from .search import index_recipe, recipe_search_index
+from .user_lists import batch_in_progress
+from .models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredients,
+    ShoppingCart,
+)
+
+# Массовая загрузка идёт через bulk_create, который не шлёт post_save.
+ingredients_imported = Signal()
+
+
+@receiver((post_save, post_delete, ingredients_imported), sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def increment_recipe_counter(sender, instance, created, **kwargs):
+    if created:
+        increment(Recipe.objects.filter(pk=instance.recipe_id),
+                  RECIPE_COUNTERS[sender], 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def decrement_recipe_counter(sender, instance, **kwargs):
+    if batch_in_progress.get():
+        return
+    increment(Recipe.objects.filter(pk=instance.recipe_id),
+              RECIPE_COUNTERS[sender], -1)
+
+
+@receiver(post_save, sender=Recipe)
+def increment_recipes_count(sender, instance, created, **kwargs):
+    if created:
+        increment(CustomUser.objects.filter(pk=instance.author_id),
+                  "recipes_count", 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def decrement_recipes_count(sender, instance, **kwargs):
+    increment(CustomUser.objects.filter(pk=instance.author_id),
+              "recipes_count", -1)
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_previous_images(sender, instance, update_fields=None, **kwargs):
+    instance._previous_images = {}
+    if instance._state.adding:
+        return
+    fields = [field for field in IMAGE_FIELDS
+              if update_fields is None or field in update_fields]
+    if fields:
+        instance._previous_images = Recipe.objects.filter(
+            pk=instance.pk
+        ).values(*fields).first() or {}
+
+
+@receiver(post_save, sender=Recipe)
+def collect_replaced_images(sender, instance, **kwargs):
+    # Сравниваем после сохранения: имя загруженного файла известно только
+    # после того, как FileField запишет его в хранилище.
+    schedule_collect(
+        name
+        for field, name in getattr(instance, "_previous_images", {}).items()
+        if name != getattr(instance, field).name
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+def collect_deleted_images(sender, instance, **kwargs):
+    schedule_collect(getattr(instance, field).name for field in IMAGE_FIELDS)
+
+
+@receiver(post_save, sender=Recipe)
+def update_search_index(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not {"name", "text"} & set(
+        update_fields
+    ):
+        return
+    index_recipe(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_from_search_index(sender, instance, **kwargs):
+    recipe_search_index.remove(instance.pk)
+
+
+# Ингредиенты рецепта меняются массовыми операциями без сигналов, поэтому
+# индекс сбрасывается при любом сохранении рецепта, после коммита.
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=RecipeIngredients)
+def invalidate_match_index(sender, **kwargs):
+    transaction.on_commit(recipe_match_index.invalidate)
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_to_followers(sender, instance, created, **kwargs):
+    if created:
+        schedule_fan_out(instance)
+
+
+# Счётчик подписчиков меняется раньше обработчиков ленты ниже: по нему
+# они решают, раскладывать ли рецепты автора.
+@receiver(post_save, sender=Follow)
+def increment_followers_count(sender, instance, created, **kwargs):
+    if created:
+        increment(CustomUser.objects.filter(pk=instance.author_id),
+                  "followers_count", 1)
+
+
+@receiver(post_delete, sender=Follow)
+def decrement_followers_count(sender, instance, **kwargs):
+    increment(CustomUser.objects.filter(pk=instance.author_id),
+              "followers_count", -1)
+    schedule_fill_after_unfollow(instance.author_id)
+
+
+@receiver(post_save, sender=Follow)
+def fill_follower_feed(sender, instance, created, **kwargs):
+    if created:
+        add_author_to_feed(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def clear_follower_feed(sender, instance, **kwargs):
+    remove_author_from_feed(instance.user_id, instance.author_id)
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+@receiver((post_save, post_delete), sender=Follow)
+def invalidate_memberships(sender, instance, **kwargs):
+    if batch_in_progress.get():
+        return
+    invalidate_members(sender, instance.user_id)
@@ -0,0 +1,36 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Файловое хранилище с адресацией по содержимому.
+
+    Имя файла — sha256 содержимого в исходном каталоге upload_to, поэтому
+    одинаковые картинки хранятся один раз, а сами файлы никогда не
+    меняются и могут кэшироваться навсегда. Удалением занимается
+    recipes.images.collect_orphans, когда на файл не осталось ссылок.
+
+    Повторная загрузка существующего файла ничего не пишет, но обновляет
+    время изменения: ссылка на файл ещё не закоммичена, и сборщик не
+    должен удалить его в течение RECIPE_IMAGE_ORPHAN_GRACE."""
+
+    def save(self, name, content, max_length=None):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        directory, filename = posixpath.split(name)
+        extension = posixpath.splitext(filename)[1].lower()
+        name = posixpath.join(directory, digest[:2], digest + extension)
+        if self.exists(name):
+            try:
+                os.utime(self.path(name))
+                return name
+            except FileNotFoundError:
+                # Сборщик успел удалить файл — записываем заново.
+                pass
+        return super().save(name, content, max_length)
@@ -0,0 +1,91 @@
+from contextvars import ContextVar
+
+from django.db import transaction
+
+from .counters import RECIPE_COUNTERS, increment
+from .events import recipes_changed
+from .memberships import invalidate_members
+from .models import Recipe
+
+ADDED = "added"
+ALREADY_ADDED = "already_added"
+REMOVED = "removed"
+NOT_IN_LIST = "not_in_list"
+NOT_FOUND = "not_found"
+
+# Пока идёт пакетное удаление, обработчики post_delete избранного и
+# списка покупок ничего не делают: счётчики, множества и кэш ответов
+# обновляются один раз на весь пакет.
+batch_in_progress = ContextVar("batch_in_progress", default=False)
+
+
+def split_recipe_ids(model, user, recipe_ids):
+    """Делит id на несуществующие, уже добавленные пользователем и
+    остальные — двумя запросами на весь пакет.
+
+    Рецепты блокируются SELECT ... FOR UPDATE до конца транзакции. Вставка
+    в избранное или список покупок проверяет внешний ключ с блокировкой
+    FOR KEY SHARE, поэтому параллельная запись для тех же рецептов ждёт
+    коммита, а уже закоммиченная видна здесь. Так добавленные и удалённые
+    строки известны точно, и счётчики не расходятся."""
+    existing = set(
+        Recipe.objects.select_for_update().filter(pk__in=recipe_ids)
+        .order_by("pk").values_list("pk", flat=True)
+    )
+    in_list = set(
+        model.objects.filter(user=user, recipe_id__in=existing)
+        .values_list("recipe_id", flat=True)
+    )
+    return existing, in_list
+
+
+@transaction.atomic
+def add_recipes(model, user, recipe_ids):
+    """Добавляет рецепты в избранное или список покупок одним INSERT.
+    ignore_conflicts — страховка: после блокировки в split_recipe_ids
+    конфликтов быть не должно."""
+    existing, in_list = split_recipe_ids(model, user, recipe_ids)
+    new_ids = existing - in_list
+    if new_ids:
+        model.objects.bulk_create(
+            [model(user=user, recipe_id=recipe_id) for recipe_id in new_ids],
+            ignore_conflicts=True,
+        )
+        increment(Recipe.objects.filter(pk__in=new_ids),
+                  RECIPE_COUNTERS[model], 1)
+        invalidate_members(model, user.pk)
+        recipes_changed.send(sender=Recipe, recipe_ids=list(new_ids))
+    return {
+        recipe_id: (
+            NOT_FOUND if recipe_id not in existing
+            else ALREADY_ADDED if recipe_id in in_list
+            else ADDED
+        )
+        for recipe_id in recipe_ids
+    }
+
+
+@transaction.atomic
+def remove_recipes(model, user, recipe_ids):
+    """Удаляет рецепты из списка. Обработчики post_delete отключены на
+    время удаления — счётчики и множества пользователя обновляются сразу
+    для всего пакета."""
+    existing, in_list = split_recipe_ids(model, user, recipe_ids)
+    if in_list:
+        token = batch_in_progress.set(True)
+        try:
+            model.objects.filter(user=user, recipe_id__in=in_list).delete()
+        finally:
+            batch_in_progress.reset(token)
+        increment(Recipe.objects.filter(pk__in=in_list),
+                  RECIPE_COUNTERS[model], -1)
+        invalidate_members(model, user.pk)
+        recipes_changed.send(sender=Recipe, recipe_ids=list(in_list))
+    return {
+        recipe_id: (
+            NOT_FOUND if recipe_id not in existing
+            else REMOVED if recipe_id in in_list
+            else NOT_IN_LIST
+        )
+        for recipe_id in recipe_ids
+    }
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.4 on 2026-10-17 07:53
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_followers_count(apps, schema_editor):
+    User = apps.get_model("users", "CustomUser")
+    Follow = apps.get_model("users", "Follow")
+    User.objects.update(
+        followers_count=Coalesce(
+            Subquery(
+                Follow.objects.filter(author=OuterRef("pk"))
+                .order_by()
+                .values("author")
+                .annotate(total=Count("pk"))
+                .values("total")
+            ),
+            Value(0),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0005_customuser_recipes_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customuser",
+            name="followers_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Количество подписчиков"
+            ),
+        ),
+        migrations.RunPython(fill_followers_count, migrations.RunPython.noop),
+    ]